@@ -32,7 +32,6 @@ setup(
         "docker",
         "PySocks",
         "anytree",
-        "transitions",
         "deepdiff",
     ],
     extras_require={"develop": [
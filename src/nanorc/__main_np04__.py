@@ -46,7 +46,9 @@ from nanorc.nano_context import NanoContext
 @click.option('--cfg-dumpdir', type=click.Path(), default="./", help='Path where the config gets copied on start')
 @click.option('--dotnanorc', type=click.Path(), default="~/.nanorc.json", help='A JSON file which has auth/socket for the DB services')
 @click.option('--kerberos/--no-kerberos', default=False, help='Whether you want to use kerberos for communicating between processes')
-@click.option('--pm', type=str, default="ssh://", help='Process manager, can be: ssh://, kind://, or k8s://np04-srv-015:31000, for example', callback=argval.validate_pm)
+@click.option('--pm', type=str, default="ssh://", help='Process manager, can be: ssh:// (options: ssh://?parallel=32&per-host=8&multiplex=yes&launcher=app|host&grace=30), local:// (same options, apps on this host without ssh), kind:// or k8s://np04-srv-015:31000 (options: k8s://host:port?parallel=16&warm-pool=no&prepull=no), for example', callback=argval.validate_pm)
+@click.option('--command-concurrency', type=int, default=32, help='Maximum number of applications a subsystem sends a command to at the same time (1 sends them one after the other)', callback=argval.validate_command_concurrency)
+@click.option('--health-interval', type=float, default=2, help='Period (in seconds) at which the applications are probed in the background to check that they are alive', callback=argval.validate_health_interval)
 @click.option('--web/--no-web', is_flag=True, default=False, help='whether to spawn webui')
 @click.option('--tui/--no-tui', is_flag=True, default=False, help='whether to use TUI')
 @click.option('--partition-number', type=int, default=0, help='Which partition number to run', callback=argval.validate_partition_number)
@@ -55,7 +57,7 @@ from nanorc.nano_context import NanoContext
 @click.argument('partition-label', type=str, callback=argval.validate_partition)
 @click.pass_obj
 @click.pass_context
-def np04cli(ctx, obj, traceback, loglevel, elisa_conf, log_path, cfg_dumpdir, dotnanorc, kerberos, timeout, partition_number, partition_label, web, tui, pm, cfg_dir, user):
+def np04cli(ctx, obj, traceback, loglevel, elisa_conf, log_path, cfg_dumpdir, dotnanorc, kerberos, timeout, partition_number, partition_label, web, tui, pm, command_concurrency, health_interval, cfg_dir, user):
 
 
 
@@ -113,7 +115,9 @@ def np04cli(ctx, obj, traceback, loglevel, elisa_conf, log_path, cfg_dumpdir, do
             timeout = timeout,
             use_kerb = kerberos,
             port_offset = port_offset,
-            pm = pm
+            pm = pm,
+            command_concurrency = command_concurrency,
+            health_interval = health_interval,
         )
         credentials.set_partition(partition_number=partition_number,apparatus_id=rc.apparatus_id)
 
@@ -47,12 +47,14 @@ from nanorc.nano_context import NanoContext
 @click.option('--partition-number', type=int, default=0, help='Which partition number to run', callback=argval.validate_partition_number)
 @click.option('--web/--no-web', is_flag=True, default=False, help='whether to spawn webui')
 @click.option('--tui/--no-tui', is_flag=True, default=False, help='whether to use TUI')
-@click.option('--pm', type=str, default="ssh://", help='Process manager, can be: ssh://, kind://, or k8s://np04-srv-015:31000, for example', callback=argval.validate_pm)
+@click.option('--pm', type=str, default="ssh://", help='Process manager, can be: ssh:// (options: ssh://?parallel=32&per-host=8&multiplex=yes&launcher=app|host&grace=30), local:// (same options, apps on this host without ssh), kind:// or k8s://np04-srv-015:31000 (options: k8s://host:port?parallel=16&warm-pool=no&prepull=no), for example', callback=argval.validate_pm)
+@click.option('--command-concurrency', type=int, default=32, help='Maximum number of applications a subsystem sends a command to at the same time (1 sends them one after the other)', callback=argval.validate_command_concurrency)
+@click.option('--health-interval', type=float, default=2, help='Period (in seconds) at which the applications are probed in the background to check that they are alive', callback=argval.validate_health_interval)
 @click.argument('cfg_dir', type=str, callback=argval.validate_conf)
 @click.argument('partition-label', type=str, callback=argval.validate_partition)
 @click.pass_obj
 @click.pass_context
-def timingcli(ctx, obj, traceback, pm, loglevel, log_path, cfg_dumpdir, kerberos, timeout, partition_number, partition_label, web, tui, cfg_dir):
+def timingcli(ctx, obj, traceback, pm, command_concurrency, health_interval, loglevel, log_path, cfg_dumpdir, kerberos, timeout, partition_number, partition_label, web, tui, cfg_dir):
     obj.print_traceback = traceback
     credentials.user = 'user'
     ctx.command.shell.prompt = f"{credentials.user}@timingrc> "
@@ -89,7 +91,9 @@ def timingcli(ctx, obj, traceback, pm, loglevel, log_path, cfg_dumpdir, kerberos
             timeout = timeout,
             pm = pm,
             use_kerb = kerberos,
-            port_offset = port_offset
+            port_offset = port_offset,
+            command_concurrency = command_concurrency,
+            health_interval = health_interval,
         )
 
         rc.log_path = os.path.abspath(log_path)
@@ -1,144 +1,100 @@
 import logging
 import requests
-import queue
 import json
 import time
 import socket
-import socks
 import threading
 
-from flask import Flask, request, cli
-from multiprocessing import Process, Queue
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests.adapters import HTTPAdapter
 from rich.console import Console
+from .healthmon import probe_app
+from .metrics import registry as metrics
+from .tunnel import SocksTunnel
 from rich.pretty import Pretty
 from .sshpm import AppProcessDescriptor
 
 from typing import Union, NoReturn
 
 
-log = logging.getLogger("werkzeug")
-log.setLevel(logging.ERROR)
-cli.show_server_banner = lambda *_: None
-
-class ResponseDispatcher(threading.Thread):
+class ResponseHandler(BaseHTTPRequestHandler):
+    """
+    Receives the replies of the applications and hands them straight to the listener
+    """
 
-    STOP="RESPONSE_QUEUE_STOP"
+    def _answer(self, code: int, text: str) -> NoReturn:
+        body = text.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> NoReturn:
+        if self.path != "/":
+            self._answer(404, "Not found")
+            return
+        self._answer(200, "ready")
 
-    def __init__(self, listener):
-        threading.Thread.__init__(self)
-        self.listener = listener
+    def do_POST(self) -> NoReturn:
+        if self.path != "/response":
+            self._answer(404, "Not found")
+            return
 
-    def run(self) -> NoReturn:
-        while True:
-            r = self.listener.response_queue.get()
-            if r == self.STOP:
-                break
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            reply = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self.server.listener.log.error(f"Received a reply that isn't json: {str(e)}")
+            self._answer(400, "Bad reply")
+            return
 
-            self.listener.notify(r)
+        try:
+            self.server.listener.notify(reply)
+        except Exception as e:
+            self.server.listener.log.error(f"Couldn't dispatch reply {reply}: {str(e)}")
+        self._answer(200, "Response received")
 
-    def stop(self) -> NoReturn:
-        self.listener.response_queue.put_nowait(self.STOP)
-        self.join()
+    def log_message(self, format, *args) -> NoReturn:
+        pass
 
-class FlaskManager(threading.Thread):
-    def __init__(self, logger, queue, port):
-        threading.Thread.__init__(self)
-        self.log = logger
-        self.flask = None
-        self.queue = queue
-        self.port = port
-        self.ready_lock = threading.Lock()
-        self.ready_lock.acquire()
-
-    def _create_flask(self) -> Process:
-        app = Flask(__name__)
-
-        def index():
-            json = request.get_json(force=True)
-            # enqueue command reply
-            self.queue.put(json)
-            return "Response received"
-
-        def get():
-            return "ready"
-
-        app.add_url_rule("/response", "index", index, methods=["POST"])
-        app.add_url_rule("/", "get", get, methods=["GET"])
-        thread_name = f'listener'
-        flask_srv = Process(target=app.run, kwargs={"host": "0.0.0.0", "port": self.port}, name=thread_name)
-        flask_srv.daemon = False
-        flask_srv.start()
-        self.log.info(f'ResponseListener Flask lives on PID: {flask_srv.pid}')
-        ## app.is_ready() would be good here, rather horrible polling inside a try
-        tries=0
-        while True:
-            if tries>20:
-                self.log.error('Cannot ping the ResponseListener\nNothing will work!!')
-                self.log.error('This can happen if the web proxy is on at NP04.'+
-                               '\nExit NanoRC and try again after executing:'+
-                               '\nsource ~np04daq/bin/web_proxy.sh -u')
-                raise RuntimeError("Cannot create a response listener")
-            tries += 1
-            try:
-                resp = requests.get(f"http://0.0.0.0:{self.port}/")
-                if resp.text == "ready":
-                    break
-            except Exception as e:
-                pass
-                # print(e)
-            time.sleep(0.5)
-
-        # We don't release that lock before we have received a "ready" from the listener
-        self.ready_lock.release()
-        return flask_srv
-
-    def stop(self) -> NoReturn:
-        self.flask.terminate()
-        self.flask.join()
-        self.join()
-
-
-    def _create_and_join_flask(self):
-        if not self.ready_lock.locked:
-            self.ready_lock.acquire()
-
-        self.flask = self._create_flask()
-        self.flask.join()
-        self.log.info(f'ResponseListener: Flask joined')
-
-    def run(self) -> NoReturn:
-        self._create_and_join_flask()
 
 class ResponseListener:
     """
     This class describes a notification listener.
+
+    The HTTP server runs in a thread of this process and is bound (hence ready) once the constructor returns.
     """
     def __init__(self, port : int ):
         self.log = logging.getLogger("ResponseListener")
         self.port = port
-        self.response_queue = None
-        self.flask_manager = None
-        self.dispatcher = None
+        self.server = None
+        self.server_thread = None
+        self.handlers = {}
+        self.start()
 
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        result = sock.connect_ex(('localhost',self.port))
-        if result == 0:
-            raise RuntimeError('Port clash for the Response listener!')
-        sock.close()
+    def start(self) -> NoReturn:
+        """
+        Bind the listener to its port and start serving
+        """
+        try:
+            self.server = ThreadingHTTPServer(("0.0.0.0", self.port), ResponseHandler)
+        except OSError as e:
+            raise RuntimeError(f'Port clash for the Response listener! ({str(e)})')
+        self.server.daemon_threads = True
+        self.server.listener = self
 
-        self.response_queue = Queue()
-        self.handlers = {}
-        self.flask_manager = self.create_manager()
-        self.dispatcher = ResponseDispatcher(self)
-        self.dispatcher.start()
-
-    def create_manager(self):
-        fm = FlaskManager(self.log, self.response_queue, self.port) # locked
-        fm.start() # should unlock
-        if not fm.ready_lock.acquire(timeout=12): # make sure that everything is ready
-            raise RuntimeError("Cannot create a response listener!!")
-        fm.ready_lock.release()
-        return fm
+        self.server_thread = threading.Thread(target=self.server.serve_forever, name='listener', daemon=True)
+        self.server_thread.start()
+        self.log.info(f'ResponseListener listening on port {self.port}')
+
+    def is_alive(self) -> bool:
+        return self.server_thread is not None and self.server_thread.is_alive()
+
+    def restart(self) -> NoReturn:
+        self.terminate()
+        self.start()
 
     def __del__(self):
         self.terminate()
@@ -147,13 +103,14 @@ class ResponseListener:
         """
         Terminate the listener
         """
-        if self.flask_manager:
-            self.flask_manager.stop()
-        self.flask_manager = None
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        self.server = None
 
-        if self.dispatcher:
-            self.dispatcher.stop()
-        self.dispatcher = None
+        if self.server_thread:
+            self.server_thread.join()
+        self.server_thread = None
 
 
     def register(self, app: str, handler):
@@ -204,6 +161,55 @@ class ResponseTimeout(Exception):
 class NoResponse(Exception):
     pass
 
+class ConnectionStats:
+    """
+    How the commands of an application went over its pooled HTTP connection
+
+    A command either opened a new connection or reused a pooled one,
+    the difference between the average latencies of the two is roughly the connection setup time
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.new_latency = 0.
+        self.reused_latency = 0.
+
+    def record(self, new_connection: bool, latency: float) -> NoReturn:
+        self.requests += 1
+        if new_connection:
+            self.new_connections += 1
+            self.new_latency += latency
+        else:
+            self.reused_latency += latency
+
+    def merge(self, other) -> NoReturn:
+        self.requests += other.requests
+        self.new_connections += other.new_connections
+        self.new_latency += other.new_latency
+        self.reused_latency += other.reused_latency
+
+    def hit_rate(self) -> float:
+        if not self.requests:
+            return 0.
+        return (self.requests - self.new_connections) / self.requests
+
+    def setup_time(self) -> float:
+        """
+        Estimated connection setup time in seconds, None until both kinds of requests were seen
+        """
+        reused = self.requests - self.new_connections
+        if not self.new_connections or not reused:
+            return None
+        return max(0., self.new_latency / self.new_connections - self.reused_latency / reused)
+
+    def __str__(self):
+        setup = self.setup_time()
+        return (f'{self.requests} requests, {self.new_connections} new connections, '
+                f'pool hit rate {self.hit_rate()*100:.0f}%'
+                + (f', connection setup ~{setup*1000:.1f} ms' if setup is not None else ''))
+
+
 class AppCommander:
     """docstring for DAQAppController"""
 
@@ -219,24 +225,67 @@ class AppCommander:
         self.listener_port = response_port
         self.listener_host = response_host
         self.proxy = proxy
-        self.response_queue = Queue()
+        # shared by all the applications behind the same proxy
+        self.tunnel = SocksTunnel.get(*self.proxy) if self.proxy else None
+        self.proxies = self.tunnel.proxies() if self.tunnel else None
+        # keep-alive connection to the application, reused for all the commands
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        if self.proxies:
+            self.session.proxies.update(self.proxies)
+        self.connection_stats = ConnectionStats()
+        # resolved by notify() with the reply to the last command sent
+        self.pending = None
         self.sent_cmd = None
+        # perf_counter() timestamps of the last command
+        self.send_time = None
+        self.ack_time = None
+        self.reply_time = None
 
     def __del__(self):
-        pass
+        self.close()
+
+    def close(self) -> NoReturn:
+        session = getattr(self, 'session', None)
+        if session:
+            session.close()
+        self.session = None
+        tunnel = getattr(self, 'tunnel', None)
+        if tunnel:
+            tunnel.forget(self.app_host, self.app_port)
+
+    def _connections_opened(self) -> int:
+        try:
+            adapter = self.session.get_adapter(self.app_url)
+            if self.proxies:
+                manager = adapter.proxy_manager_for(self.proxies['http'])
+            else:
+                manager = adapter.poolmanager
+            return manager.connection_from_url(self.app_url).num_connections
+        except Exception:
+            return None
 
     def notify(self, response):
-        self.response_queue.put(response)
+        future = self.pending
+        if future is None or future.done():
+            self.log.warning(f"Received a reply from {self.app} while no command was pending: {response}")
+            return
+        self.reply_time = time.perf_counter()
+        future.set_result(response)
+
+    def response_future(self) -> Future:
+        """
+        The future holding the reply to the last command sent, None if nothing was sent
+        """
+        return self.pending
 
     def ping(self):
 
-        if not self.proxy:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(1)
-        else:
-            s = socks.socksocket(socket.AF_INET, socket.SOCK_STREAM)
-            s.set_proxy(socks.SOCKS5, self.proxy[0], self.proxy[1])
-            s.settimeout(1)
+        if self.tunnel:
+            return self.tunnel.ping(self.app_host, self.app_port)
+
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.settimeout(1)
         try:
             s.connect((self.app_host, self.app_port))
             s.shutdown(2)
@@ -267,23 +316,33 @@ class AppCommander:
 
         self.log.debug(headers)
 
-        ack = requests.post(
-            self.app_url,
-            data=json.dumps(cmd),
-            headers=headers,
-            timeout=1.,
-            proxies={
-                'http': f'socks5h://{self.proxy[0]}:{self.proxy[1]}',
-                'https': f'socks5h://{self.proxy[0]}:{self.proxy[1]}'
-            } if self.proxy else None
-        )
-
-        self.log.debug(f"Ack to {self.app}: {ack.status_code}")
+        # the reply can come back before the ack, so the future has to exist first
+        self.pending = Future()
+        self.ack_time = None
+        self.reply_time = None
+        opened = self._connections_opened()
+        start = self.send_time = time.perf_counter()
+        try:
+            ack = self.session.post(
+                self.app_url,
+                data=json.dumps(cmd),
+                headers=headers,
+                timeout=1.,
+            )
+        except:
+            self.pending = None
+            raise
+        self.ack_time = time.perf_counter()
+        latency = self.ack_time - start
+        new_connection = opened is None or self._connections_opened() != opened
+        self.connection_stats.record(new_connection, latency)
+
+        self.log.debug(f"Ack to {self.app}: {ack.status_code} in {latency*1000:.1f} ms ({'new' if new_connection else 'reused'} connection)")
         self.sent_cmd = cmd_id
 
 
     def check_response(self, timeout: int = 0) -> dict:
-        """Check if a response is present in the queue
+        """Check if the response to the last command has arrived
 
         Args:
             timeout (int, optional): Timeout in seconds
@@ -295,13 +354,17 @@ class AppCommander:
             NoResponse: Description
             ResponseTimeout: Description
         """
+        future = self.pending
         try:
-            # self.log.info(f"Checking for answers from {self.app} {self.sent_cmd}")
-            r = self.response_queue.get(block=(timeout>0), timeout=timeout)
+            if future is None:
+                raise FutureTimeoutError()
+            r = future.result(timeout=timeout)
+            # consumed: a late duplicate of this reply goes to the warning in notify()
+            self.pending = None
             self.log.debug(f"Received reply from {self.app} to {self.sent_cmd}")
             self.sent_cmd = None
 
-        except queue.Empty:
+        except FutureTimeoutError:
             if not timeout:
                 raise NoResponse(f"No response available from {self.app} for command {self.sent_cmd}")
             else:
@@ -320,9 +383,10 @@ class AppSupervisor:
     Tracks the last executed and successful commands
     """
 
-    def __init__(self, console: Console, desc: AppProcessDescriptor, listener: ResponseListener, response_host: str = None, proxy: tuple = None):
+    def __init__(self, console: Console, desc: AppProcessDescriptor, listener: ResponseListener, response_host: str = None, proxy: tuple = None, monitor = None, subsystem: str = None):
         self.console = console
         self.desc = desc
+        self.subsystem = subsystem
         self.commander = AppCommander(
             console, desc.name, desc.host, desc.port, listener.port, response_host, proxy
         )
@@ -330,6 +394,20 @@ class AppSupervisor:
         self.last_ok_command = None
         self.listener = listener
         self.listener.register(desc.name, self.commander)
+        self.monitor = monitor
+        if self.monitor:
+            self.monitor.watch(self)
+
+    def health(self, fresh: bool = False):
+        """
+        Liveness of the application, from the health monitor snapshot unless fresh is asked for
+        """
+        if self.monitor is None:
+            return probe_app(self)
+        return self.monitor.get(self.desc.name, fresh)
+
+    def is_responsive(self, fresh: bool = False) -> bool:
+        return self.health(fresh).responsive()
 
     def send_command(
             self,
@@ -337,19 +415,35 @@ class AppSupervisor:
             cmd_data: dict,
             entry_state: str = "ANY",
             exit_state: str = "ANY"):
-        self.listener.flask_manager.ready_lock.acquire()
-        self.listener.flask_manager.ready_lock.release()
         self.last_sent_command = cmd_id
         self.commander.send_command(cmd_id, cmd_data, entry_state, exit_state)
 
+    def response_future(self):
+        return self.commander.response_future()
+
     def check_response(self, timeout: int = 0):
         r = self.commander.check_response(timeout)
+        self.record_latencies()
 
         if r["result"] == "OK":
             self.last_ok_command = self.last_sent_command
 
         return r
 
+    def record_latencies(self) -> NoReturn:
+        c = self.commander
+        if c.send_time is None or c.ack_time is None or c.reply_time is None:
+            return
+        labels = {
+            'subsystem': self.subsystem or '',
+            'app': self.desc.name,
+            'command': self.last_sent_command,
+        }
+        metrics.observe('nanorc_command_ack_seconds', c.ack_time - c.send_time, **labels)
+        # the reply can beat the ack
+        metrics.observe('nanorc_command_reply_seconds', max(0., c.reply_time - c.ack_time), **labels)
+        metrics.observe('nanorc_command_total_seconds', c.reply_time - c.send_time, **labels)
+
     def send_command_and_wait(
             self,
             cmd_id: str,
@@ -358,13 +452,14 @@ class AppSupervisor:
             exit_state: str = "ANY",
             timeout: int = 10,
         ):
-        self.listener.flask_manager.ready_lock.acquire()
-        self.listener.flask_manager.ready_lock.release()
         self.send_command(cmd_id, cmd_data, entry_state, exit_state)
         return self.check_response(timeout)
 
     def terminate(self):
+        if self.monitor:
+            self.monitor.unwatch(self.desc.name)
         self.listener.unregister(self.desc.name)
+        self.commander.close()
         del self.commander
 
 
@@ -19,6 +19,16 @@ def validate_timeout(ctx, param, timeout):
         raise click.BadParameter('Timeout should be >= 10')
     return timeout
 
+def validate_command_concurrency(ctx, param, concurrency):
+    if concurrency<1:
+        raise click.BadParameter('Command concurrency should be >= 1')
+    return concurrency
+
+def validate_health_interval(ctx, param, interval):
+    if interval<=0:
+        raise click.BadParameter('Health interval should be > 0')
+    return interval
+
 def validate_wait(ctx, param, wait):
     if wait<0:
         raise click.BadParameter('Wait should be >=0')
@@ -1,12 +1,15 @@
 import os.path
 import os
+import logging
 import tempfile
 import json
 import copy as cp
 import socket
+import time
 import requests
 import importlib.resources as resources
 from . import confdata
+from .confcache import ConfigCache
 from urllib.parse import urlparse
 
 class SessionNamespaceIncompatible(Exception):
@@ -31,7 +34,11 @@ class ConfigManager:
         self.scheme = None
         self.expected_std_cmds = ['init', 'conf']
         self.conf_server = upload_to
+        # step -> seconds it took
+        self.timings = {}
+        start = time.perf_counter()
         self.conf_data, self.config_query_string = self.fetch_configuration(config_url)
+        start = self._time('fetch', start)
         self.log.debug(f'"{config_url.path}" content: {list(self.conf_data.keys())}')
 
         self._ensure_conf_pm_consistency(
@@ -51,15 +58,13 @@ class ConfigManager:
             resolve_hostname = not process_manager_description.use_k8spm()
         )
         self._log_diff('NanoRC\'s boot parsing', self.boot, self.conf_data['boot'])
+        start = self._time('boot', start)
 
         if process_manager_description.use_sshpm():
-            new_data = self._offset_ports(self.conf_data)
-            self._log_diff('NanoRC\'s port offsetting', self.conf_data, new_data)
-            self.conf_data = new_data
-
-            new_data = self._resolve_hostnames(self.conf_data)
-            self._log_diff('NanoRC\'s host resolution', self.conf_data, new_data)
+            new_data = self._rewrite_connections(self.conf_data)
+            self._log_diff('NanoRC\'s port offsetting and host resolution', self.conf_data, new_data)
             self.conf_data = new_data
+            start = self._time('connections', start)
 
         self.custom_commands = self._get_custom_commands_from_dict(self.conf_data)
         config_url._replace(scheme = '')
@@ -69,12 +74,20 @@ class ConfigManager:
 
         self.conf_server.add_configuration_data(config_url, self.conf_data)
         self.conf_url = f'{self.conf_server.get_conf_address_prefix()}?name={config_url}'
+        self._time('upload', start)
+
+    def _time(self, step, start):
+        now = time.perf_counter()
+        self.timings[step] = now - start
+        return now
 
     def _log_diff(self, title, dict_new, dict_old):
+        # the diff is expensive on big configurations, and only ever logged in debug
+        if not self.log.isEnabledFor(logging.DEBUG):
+            return
         from deepdiff import DeepDiff
         dd = DeepDiff(dict_new, dict_old)
-        dd = dd.to_json()
-        self.log.debug(f'{title}:\n{json.dumps(json.loads(dd), indent=4)}')
+        self.log.debug(f'{title}:\n{dd.to_json(indent=4)}')
 
 
     def _ensure_conf_pm_consistency(self, data, pm, conf_name):
@@ -134,19 +147,33 @@ class ConfigManager:
         version = config_url.query
         conf_name = config_url.netloc
         r = None
+        cache = ConfigCache()
 
         if version:
             self.log.info(f'Using version {version} of \'{conf_name}\'.')
             conf_query_str = svc_url+'/retrieveVersion?name='+conf_name+'&version='+version
+            cache_version = version
         else:
             self.log.info(f'Using latest version of \'{conf_name}\'.')
             conf_query_str = svc_url+'/retrieveLast?name='+conf_name
+            # a version never changes, so the latest one only needs to be looked up
+            cache_version = self._latest_version(svc_url, conf_name)
+
+        if cache_version is not None:
+            data = cache.get(svc_url, conf_name, cache_version)
+            if data is not None:
+                self.log.info(f'Using the cached copy of \'{conf_name}\' version {cache_version}')
+                return (data, conf_query_str)
 
         try:
             self.log.debug(f'Configuration request: http://{conf_query_str}')
             r = requests.get("http://"+conf_query_str)
             if r.status_code == 200:
-                return (r.json(), conf_query_str)
+                data = r.json()
+                # only cache the latest if nothing was uploaded in between
+                if cache_version is not None and (version or self._latest_version(svc_url, conf_name) == cache_version):
+                    cache.put(svc_url, conf_name, cache_version, r.content)
+                return (data, conf_query_str)
             else:
                 raise RuntimeError(f'Couldn\'t get the configuration {conf_name} from {svc_url}')
 
@@ -158,6 +185,20 @@ class ConfigManager:
             exit(1)
 
 
+    def _latest_version(self, svc_url, conf_name):
+        """
+        The latest version of a configuration according to the service, None if it can't tell
+        """
+        try:
+            r = requests.get(f'http://{svc_url}/listVersions?name={conf_name}', timeout=5)
+            if r.status_code != 200:
+                return None
+            versions = r.json().get('versions')
+            return str(max(int(v) for v in versions)) if versions else None
+        except Exception as e:
+            self.log.debug(f'Couldn\'t list the versions of \'{conf_name}\': {str(e)}')
+            return None
+
     def fetch_from_file_system(self,config_url):
         from .utils import get_json_recursive
         return (get_json_recursive(config_url.path), f'file://{config_url.path}')
@@ -209,68 +250,52 @@ class ConfigManager:
         return self.custom_commands
 
 
-    def _resolve_hostnames(self, conf_data):
-        conf_port_host_resolved = cp.deepcopy(conf_data)
+    def _rewrite_connections(self, conf_data):
+        """
+        Offset the ports and resolve the hosts of the connections in one pass
 
+        Only the apps with a connection that changed get new dicts, everything else is shared with conf_data.
+        """
         hosts = self.boot.get('hosts-data',{})
-        from nanorc.utils import parse_string
-
-        for app_name, app_data in conf_port_host_resolved.items():
-            if not type(app_data) == dict:
-                continue
-
-            if not 'init' in app_data:
-                continue
-
-            init_data = app_data['init']
-
-            if not "connections" in init_data:
-                return conf_data
-
-            for connection in init_data['connections']:
-                if "queue://" in connection['uri']:
-                    continue
-
-                origuri = connection['uri']
-                connection['uri'] = parse_string(connection['uri'], hosts)
-                self.log.debug(f" - '{connection['id']['uid']}': {connection['uri']} ({origuri})")
-
-            conf_port_host_resolved[app_name]['init'] = init_data
-
-        return conf_port_host_resolved
-
-
-    def _offset_ports(self, conf_data):
-        conf_port_offset = cp.deepcopy(conf_data)
         external_connections = self.boot.get('external_connections', [])
+        from nanorc.utils import parse_string
 
-        for app_name, app_data in conf_port_offset.items():
+        new_conf = dict(conf_data)
+        for app_name, app_data in conf_data.items():
             if not type(app_data) == dict:
                 continue
 
-            if not 'init' in app_data:
-                continue
-
-            init_data = app_data['init']
-            if not "connections" in init_data:
+            init_data = app_data.get('init')
+            if not init_data or not "connections" in init_data:
                 continue
 
+            connections = []
+            changed = False
             for connection in init_data['connections']:
-                if "queue://" in connection['uri']:
+                uri = origuri = connection['uri']
+                if "queue://" in uri:
+                    connections.append(connection)
                     continue
 
                 if not connection['id']['uid'] in external_connections:
                     try:
-                        port = urlparse(connection['uri']).port
+                        port = urlparse(uri).port
                         newport = port + self.port_offset
-                        connection['uri'] = connection['uri'].replace(str(port), str(newport))
-                        self.log.debug(f" - '{connection['id']['uid']}': {connection['uri']}")
+                        uri = uri.replace(str(port), str(newport))
                     except Exception as e:
-                        self.log.debug(f" - '{connection['id']['uid']}' ('{connection['uri']}') port wasn\'t offset, reason: {str(e)}")
+                        self.log.debug(f" - '{connection['id']['uid']}' ('{uri}') port wasn\'t offset, reason: {str(e)}")
+
+                uri = parse_string(uri, hosts)
+                if uri != origuri:
+                    self.log.debug(f" - '{connection['id']['uid']}': {uri} ({origuri})")
+                    connection = {**connection, 'uri': uri}
+                    changed = True
+                connections.append(connection)
 
-            conf_port_offset[app_name]['init'] = init_data
+            if changed:
+                new_conf[app_name] = {**app_data, 'init': {**init_data, 'connections': connections}}
 
-        return conf_port_offset
+        return new_conf
 
 
 
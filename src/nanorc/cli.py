@@ -87,7 +87,9 @@ def updateLogLevel(loglevel):
 @click.option('--log-path', type=click.Path(exists=True), default=None, help='Where the logs should go (on localhost of applications)')
 @click.option('--kerberos/--no-kerberos', default=True, help='Whether you want to use kerberos for communicating between processes')
 @click.option('--logbook-prefix', type=str, default="logbook", help='Prefix for the logbook file')
-@click.option('--pm', type=str, default="ssh://", help='Process manager, can be: ssh://, kind://, or k8s://np04-srv-015:31000, for example', callback=argval.validate_pm)
+@click.option('--pm', type=str, default="ssh://", help='Process manager, can be: ssh:// (options: ssh://?parallel=32&per-host=8&multiplex=yes&launcher=app|host&grace=30), local:// (same options, apps on this host without ssh), kind:// or k8s://np04-srv-015:31000 (options: k8s://host:port?parallel=16&warm-pool=no&prepull=no), for example', callback=argval.validate_pm)
+@click.option('--command-concurrency', type=int, default=32, help='Maximum number of applications a subsystem sends a command to at the same time (1 sends them one after the other)', callback=argval.validate_command_concurrency)
+@click.option('--health-interval', type=float, default=2, help='Period (in seconds) at which the applications are probed in the background to check that they are alive', callback=argval.validate_health_interval)
 @click.option('--web/--no-web', is_flag=True, default=False, help='whether to spawn webui')
 @click.option('--tui/--no-tui', is_flag=True, default=False, help='whether to use TUI')
 @accept_timeout(60)
@@ -97,7 +99,7 @@ def updateLogLevel(loglevel):
 @click.argument('partition-label', type=str, callback=argval.validate_partition)
 @click.pass_obj
 @click.pass_context
-def cli(ctx, obj, traceback, loglevel, cfg_dumpdir, log_path, logbook_prefix, timeout, kerberos, partition_number, web, top_cfg, partition_label, tui, pm):
+def cli(ctx, obj, traceback, loglevel, cfg_dumpdir, log_path, logbook_prefix, timeout, kerberos, partition_number, web, top_cfg, partition_label, tui, pm, command_concurrency, health_interval):
     obj.print_traceback = traceback
     credentials.user = 'user'
     ctx.command.shell.prompt = f'{credentials.user}@rc> '
@@ -136,7 +138,9 @@ def cli(ctx, obj, traceback, loglevel, cfg_dumpdir, log_path, logbook_prefix, ti
             partition_label = partition_label,
             logbook_prefix = logbook_prefix,
             pm = pm,
-            port_offset = port_offset
+            port_offset = port_offset,
+            command_concurrency = command_concurrency,
+            health_interval = health_interval,
         )
 
         if log_path:
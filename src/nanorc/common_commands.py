@@ -57,6 +57,13 @@ def status(obj: NanoContext):
     obj.rc.status()
 
 
+@click.command()
+@click.option('--prometheus', type=bool, is_flag=True, default=False, help='Print the raw histograms in the Prometheus text format')
+@click.pass_obj
+def metrics(obj: NanoContext, prometheus:bool):
+    obj.rc.metrics(prometheus=prometheus)
+
+
 @click.command()
 @click.option('--legend', type=bool, is_flag=True, default=False)
 @click.pass_obj
@@ -306,6 +313,7 @@ def add_common_cmds(shell, end_of_run_cmds=True):
     shell.add_command(message             , 'message'             )
     shell.add_command(status              , 'status'              )
     shell.add_command(ls                  , 'ls'                  )
+    shell.add_command(metrics             , 'metrics'             )
     shell.add_command(pin_threads         , 'pin_threads'         )
     shell.add_command(boot                , 'boot'                )
     shell.add_command(conf                , 'conf'                )
@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'nanorc', 'configs')
+
+
+class ConfigCache:
+    """
+    On-disk cache of the configurations of the configuration service
+
+    The configurations are stored as received, by the sha256 of their content (blobs/), and
+    (service, name, version) points to one of them (refs/). A blob that doesn't
+    match its hash anymore is dropped and fetched again.
+    """
+
+    def __init__(self, path: str = None):
+        self.log = logging.getLogger(__name__)
+        self.path = path or default_cache_dir()
+
+    def _ref_path(self, service: str, name: str, version) -> str:
+        key = hashlib.sha256(f'{service}|{name}|{version}'.encode()).hexdigest()
+        return os.path.join(self.path, 'refs', key+'.json')
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.path, 'blobs', digest+'.json')
+
+    @staticmethod
+    def _write(path: str, content: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp, path)
+        except:
+            os.unlink(tmp)
+            raise
+
+    def get(self, service: str, name: str, version):
+        """
+        The configuration, None if it isn't cached (or the cached copy is corrupted)
+        """
+        try:
+            with open(self._ref_path(service, name, version), 'r') as f:
+                digest = json.load(f)['sha256']
+            with open(self._blob_path(digest), 'rb') as f:
+                content = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if hashlib.sha256(content).hexdigest() != digest:
+            self.log.warning(f'Cached copy of \'{name}\' version {version} is corrupted, dropping it')
+            for path in [self._ref_path(service, name, version), self._blob_path(digest)]:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            return None
+        return json.loads(content)
+
+    def put(self, service: str, name: str, version, content: bytes) -> None:
+        """
+        Cache the configuration as the service sent it: the order of the apps and children is kept
+        """
+        try:
+            digest = hashlib.sha256(content).hexdigest()
+            if not os.path.exists(self._blob_path(digest)):
+                self._write(self._blob_path(digest), content)
+            ref = {'service': service, 'name': name, 'version': version, 'sha256': digest}
+            self._write(self._ref_path(service, name, version), json.dumps(ref).encode())
+        except OSError as e:
+            # not being able to cache never stops a boot
+            self.log.warning(f'Couldn\'t cache \'{name}\' version {version} in {self.path}: {str(e)}')
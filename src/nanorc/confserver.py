@@ -1,8 +1,71 @@
 import logging
+import threading
+import gzip
+import hashlib
 from rich.console import Console
 from flask_restful import Resource
 from flask import request, abort, make_response, jsonify, abort
 
+# slices smaller than this (in bytes) aren't worth compressing
+GZIP_MIN_SIZE = 1024
+
+
+class ConfSlice:
+    """
+    A piece of a configuration (all of it, an app, or a command of an app), serialised once
+
+    It's serialised with jsonify, like extract_data does, so the clients (and the ETag) get the same bytes.
+    Needs an application context.
+    """
+
+    def __init__(self, data):
+        body = jsonify(data).get_data()
+        self.status = 204 if body == b'{}\n' else 200
+        self.body = body if self.status == 200 else b''
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self._gzipped = None
+
+    def gzipped(self) -> bytes:
+        # only compressed if a client asks for it, then kept
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body)
+        return self._gzipped
+
+
+def serialise_configuration(data) -> dict:
+    """
+    The slices of a configuration, as (app_name, cmd_name) -> ConfSlice, needs an application context
+
+    Only what extract_data would serve without complaining is there, the rest goes through it.
+    """
+    slices = {(None, None): ConfSlice(data)}
+    for app_name, app_data in data.items():
+        if not app_data: continue
+        slices[(app_name, None)] = ConfSlice(app_data)
+        if not isinstance(app_data, dict): continue
+        for cmd_name, cmd_data in app_data.items():
+            if not cmd_data: continue
+            slices[(app_name, cmd_name)] = ConfSlice(cmd_data)
+    return slices
+
+
+def serve_slice(request, conf_slice):
+    gz = conf_slice.status == 200 and len(conf_slice.body) >= GZIP_MIN_SIZE and 'gzip' in request.accept_encodings
+    # the compressed representation is a different one, so it gets its own strong ETag
+    etag = conf_slice.etag + ('-gz' if gz else '')
+
+    if request.if_none_match and request.if_none_match.contains(etag):
+        res = make_response(b'', 304)
+    else:
+        res = make_response(conf_slice.gzipped() if gz else conf_slice.body, conf_slice.status)
+        res.headers['Content-Type'] = 'application/json'
+        if gz:
+            res.headers['Content-Encoding'] = 'gzip'
+    res.set_etag(etag)
+    res.headers['Vary'] = 'Accept-Encoding'
+    return res
+
+
 def extract_data(request, dico, conf_name):
     app_name = request.args.get('app_name')
     cmd_name = request.args.get('cmd_name')
@@ -32,8 +95,12 @@ def extract_data(request, dico, conf_name):
     return res
 
 class ConfigurationEndpoint(Resource):
-    def __init__(self, config_data, *args, **kwargs):
+    def __init__(self, config_data, slices, lock, *args, **kwargs):
         self.conf_data = config_data
+        self.slices = slices
+        # the requests are served concurrently: the stores are only read or replaced under this lock,
+        # a configuration itself is never modified once stored
+        self.lock = lock
         super().__init__(*args, **kwargs)
         self.log = logging.getLogger('ConfigurationEndpoint')
 
@@ -43,7 +110,10 @@ class ConfigurationEndpoint(Resource):
         try:
             name = request.args['name']
             conf_json = request.json
-            self.conf_data[name] = conf_json
+            slices = serialise_configuration(conf_json)
+            with self.lock:
+                self.slices[name] = slices
+                self.conf_data[name] = conf_json
             res['success'] = True
         except Exception as e:
             res['error'] = str(e)
@@ -54,14 +124,22 @@ class ConfigurationEndpoint(Resource):
         self.log.debug(f'GET "ConfigurationEndpoint" request with args: {request.args}')
         name = request.args.get('name')
 
+        with self.lock:
+            names = list(self.conf_data.keys())
+            conf_data = self.conf_data.get(name)
+            slices = self.slices.get(name, {})
+
         if not name:
-            return make_response(jsonify(list(self.conf_data.keys())))
+            return make_response(jsonify(names))
 
         self.log.debug(f"Looking for config {name}")
-        if name not in self.conf_data:
-            abort(404, description=f'{name} not in configurations store, available configs are: {list(self.conf_data.keys())}')
+        if conf_data is None:
+            abort(404, description=f'{name} not in configurations store, available configs are: {names}')
 
-        return extract_data(request, self.conf_data[name], name)
+        conf_slice = slices.get((request.args.get('app_name'), request.args.get('cmd_name')))
+        if conf_slice:
+            return serve_slice(request, conf_slice)
+        return extract_data(request, conf_data, name)
 
 class ConfigUploadFailed(Exception):
     """Couldn't upload the configuration """
@@ -86,8 +164,13 @@ class ConfServer:
     def __init__(self, port):
         self.log = logging.getLogger('nano-conf-service')
         self.config_data = {}
+        # name -> serialised slices of the configuration, replaced as a whole on update
+        self.slices = {}
         self.uploaded_name = set()
+        # configurations are added from several threads when the tree is built, and read by the server threads
+        self.lock = threading.Lock()
         self.port = port
+        self.server = None
         self._start_conf_service()
 
     def get_conf_address_prefix(self):
@@ -97,66 +180,50 @@ class ConfServer:
     def _start_conf_service(self):
         from flask import Flask
         from flask_restful import Api
+        from werkzeug.serving import make_server
 
         self.app = Flask('nano-conf-svc')
         self.api = Api(self.app)
         self.api.add_resource(
             ConfigurationEndpoint, "/configuration",
             methods = ['GET', 'POST'],
-            resource_class_kwargs = {"config_data":self.config_data}
+            resource_class_kwargs = {"config_data":self.config_data, "slices":self.slices, "lock":self.lock}
         )
 
-        from .utils import FlaskManager
-        self.manager = FlaskManager(
-            port = self.port,
-            app = self.app,
-            name = "nano-conf-svc"
-        )
-
-        self.manager.start()
-        while not self.manager.is_ready():
-            from time import sleep
-            sleep(0.1)
-
-    def _upload_data(self, name,data):
-        from requests import post
-        header = {
-            'Accept' : 'application/json',
-            'Content-Type':'application/json'
-        }
-        import json
-
-        try:
-            r = post(
-                f'http://0.0.0.0:{self.port}/configuration?name={name}',
-                headers=header,
-                data=json.dumps(data)
-            )
-        except Exception as e:
-            raise ConfigUploadFailed(name) from e
-
-        if not r.json()['success']:
-            raise ConfigUploadFailed(name)
-
+        # served from this process, one thread per request, so the apps get their configuration concurrently
+        # (without a log line for each of these requests)
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        self.server = make_server('0.0.0.0', self.port, self.app, threaded=True)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, name='nano-conf-svc', daemon=True)
+        self.server_thread.start()
+        self.log.info(f'nano-conf-svc listening on port {self.port}')
 
     def add_configuration_data(self, name, data):
         from nanorc.argval import validate_conf_name
         validate_conf_name({}, {}, name)
 
-        if name in self.uploaded_name:
-            raise ConfigurationAlreadyPresent(name)
-
-        self._upload_data(name, data)
-        self.uploaded_name.add(name)
+        with self.lock:
+            if name in self.uploaded_name:
+                raise ConfigurationAlreadyPresent(name)
+            self.uploaded_name.add(name)
+        with self.app.app_context():
+            slices = serialise_configuration(data)
+        with self.lock:
+            self.slices[name] = slices
+            self.config_data[name] = data
 
     def update_configuration_data(self, name, data):
         from nanorc.argval import validate_conf_name
         validate_conf_name({}, {}, name)
 
-        if not name in self.uploaded_name:
-            raise ConfigurationNotPresent(name)
-
-        self._upload_data(name, data)
+        with self.lock:
+            if not name in self.uploaded_name:
+                raise ConfigurationNotPresent(name)
+        with self.app.app_context():
+            slices = serialise_configuration(data)
+        with self.lock:
+            self.slices[name] = slices
+            self.config_data[name] = data
 
     def update_configuration_directory(self, name, path):
         from pathlib import Path
@@ -172,4 +239,8 @@ class ConfServer:
 
         return
     def terminate(self):
-        self.manager.stop()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server_thread.join()
+            self.server = None
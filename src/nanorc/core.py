@@ -12,7 +12,8 @@ from .statefulnode import StatefulNode, CanExecuteReturnVal
 from .treebuilder import TreeBuilder
 from .cfgsvr import FileConfigSaver, DBConfigSaver
 from .credmgr import credentials
-from .node_render import print_node, print_status
+from .node_render import print_node, print_status, print_metrics
+from .metrics import registry as metrics_registry
 from .logbook import ElisaLogbook, FileLogbook
 import importlib
 from . import confdata
@@ -42,11 +43,13 @@ class NanoRC:
 
     def __init__(self, console: Console, top_cfg: str, partition_label:str, run_num_mgr, run_registry, logbook_type:str, timeout: int,
                  use_kerb=True, logbook_prefix="", fsm_cfg="partition", port_offset=0,
-                 pm=None):
+                 pm=None, command_concurrency=None, health_interval=None):
         super(NanoRC, self).__init__()
         self.log = logging.getLogger(self.__class__.__name__)
         self.console = console
         self.pm = pm
+        self.command_concurrency = command_concurrency
+        self.health_interval = health_interval
 
         self.ssh_conf = []
         if not use_kerb:
@@ -223,6 +226,8 @@ class NanoRC:
         self.log.debug(f'Executing the cmd {command} on the node {node_path.name}, using timeout = {kwargs["timeout"]}')
         transition = getattr(node_path, command)
         kwargs['pm'] = self.pm
+        kwargs['concurrency'] = self.command_concurrency
+        kwargs['health_interval'] = self.health_interval
         transition(**kwargs)
         self.return_code = node_path.return_code.value
 
@@ -241,6 +246,15 @@ class NanoRC:
             print_run_info(self.runs[-1], self.console)
         print_status(apparatus_id=self.apparatus_id, topnode=self.topnode, console=self.console, partition=self.partition)
 
+    def metrics(self, prometheus:bool=False) -> NoReturn:
+        """
+        Displays the latencies of the commands sent to the applications
+        """
+        if prometheus:
+            self.console.print(metrics_registry.to_prometheus(), markup=False, highlight=False)
+        else:
+            self.return_code = print_metrics(metrics_registry, self.console)
+
     def ls(self, leg:bool) -> NoReturn:
         """
         Print the nodes
@@ -1,8 +1,40 @@
-from transitions import Machine
-from functools import partial
+import threading
 
-class FSM(Machine):
-    def __init__(self,console, fsm_type, verbose=False):
+
+class FSMError(RuntimeError):
+    pass
+
+
+class Transition:
+    def __init__(self, source, dest):
+        self.source = source
+        self.dest = dest
+
+
+class Trigger:
+    def __init__(self, name):
+        self.name = name
+
+
+class EventData:
+    """
+    What the on_enter_*/on_exit_* callbacks of the nodes receive
+    """
+    def __init__(self, model, trigger, source, dest, kwargs):
+        self.model = model
+        self.event = Trigger(trigger)
+        self.transition = Transition(source, dest)
+        self.kwargs = kwargs
+
+
+class FSM:
+    """
+    Transition table of an fsm_conf, compiled once and shared by all the nodes (which only hold their state)
+
+    Each transition of the configuration is split in an acting transition (e.g. conf: initial -> conf_ing)
+    and a finalisor transition (end_conf: conf_ing -> configured)
+    """
+    def __init__(self, console, fsm_type, verbose=False):
         if fsm_type == 'timing':
             self.states_cfg = [ 'none', 'booted', 'initial', 'configured', 'error', 'running' ]
             self.transitions_cfg = [
@@ -73,18 +105,10 @@ class FSM(Machine):
                 ],
             }
 
-        if verbose:
-            print_friendly_transitions = set()
-            for tr in self.transitions_cfg:
-                if tr['trigger'] == 'to_error': continue
-                print_friendly_transitions.add(tr['trigger'])
-            console.print(f'FSM available states: {self.states_cfg}')
-            console.print(f'FSM available transitions: {print_friendly_transitions}')
         self.acting_transitions = []
         self.finalisor_transitions = []
 
         transition_state_to_add = []
-        transition_to_remove = []
         # we need to loop over transitions, because if they are long, new states are added
         for transition in self.transitions_cfg:
             matched_from = False
@@ -98,7 +122,8 @@ class FSM(Machine):
                 raise RuntimeError(f'Transitions \'{transition["trigger"]}\' doesn\'t match for either its source or destination state: \'{transition["source"]}\' -> \'{transition["dest"]}\', list of states: {self.states_cfg}')
 
             name = transition["trigger"]+"_ing"
-            transition_state_to_add += [name]
+            if name not in transition_state_to_add:
+                transition_state_to_add += [name]
 
             # add these new states
             self.acting_transitions.append({
@@ -113,51 +138,74 @@ class FSM(Machine):
                 "dest": transition["dest"]
             })
 
-            # remove the old direct transitions
-            transition_to_remove.append(transition)
-
-        states = self.states_cfg + transition_state_to_add
-        super().__init__(states=states, initial=states[0], send_event=True)
+        self.states = self.states_cfg + transition_state_to_add
+        self.initial = self.states[0]
+        self.transient_states = set(transition_state_to_add)
 
+        # (state, trigger) -> destination, the first matching transition wins
+        self.table = {}
         for transition in self.acting_transitions+self.finalisor_transitions:
-            self.add_transition(transition["trigger"], transition["source"], transition["dest"])
-
-    def _can_(self, transition, cls):
-        if transition in self.finalisor_transitions:
-            return False
+            sources = self.states if transition["source"] == "*" else [transition["source"]]
+            for source in sources:
+                self.table.setdefault((source, transition["trigger"]), transition["dest"])
 
-        for t in self.acting_transitions:
-            if t["trigger"] != transition:
-                continue
-            if cls.state == t["source"] or t['source'] == "*":
-                return True
+        self.acting_triggers = {t["trigger"] for t in self.acting_transitions}
+        self.triggers = self.acting_triggers | {t["trigger"] for t in self.finalisor_transitions}
 
-        return False
-
-    def _get_dest(self, transition):
+        self.destinations = {}
         for t in self.transitions_cfg:
-            if t["trigger"] == transition:
-                return t['dest']
-        raise RuntimeError(f'Transition {transition} is not a transition in your toplevelcfg.json')
-
-    def _checked_assignment(self, model, name, func):
-        if not hasattr(model, name):
-            setattr(model, name, func)
-
-    def make_node_fsm(self, node):
-        self._checked_assignment(node, "get_destination", self._get_dest)
-
-        for tr in self.acting_transitions:
-            function_name = 'on_enter_'+tr["dest"]
-            if not getattr(node, function_name, None):
-                setattr(node, function_name, node._on_enter_callback.__get__(node))
-            function_name = 'on_exit_'+tr["dest"]
-            if not getattr(node, function_name, None):
-                setattr(node, function_name, node._on_exit_callback.__get__(node))
-
-        for tr in self.acting_transitions+self.finalisor_transitions:
-            new_method = partial(self._can_, tr["trigger"], node)
-            function_name = "can_"+tr["trigger"]
-            self._checked_assignment(node, function_name, new_method)
-
-        super().add_model(node)
+            self.destinations.setdefault(t["trigger"], t["dest"])
+
+        if verbose:
+            self.print_info(console)
+
+    def print_info(self, console):
+        print_friendly_transitions = set()
+        for tr in self.transitions_cfg:
+            if tr['trigger'] == 'to_error': continue
+            print_friendly_transitions.add(tr['trigger'])
+        console.print(f'FSM available states: {self.states_cfg}')
+        console.print(f'FSM available transitions: {print_friendly_transitions}')
+
+    def can(self, state, trigger):
+        # finalisors are only ever triggered by the nodes themselves
+        if trigger not in self.acting_triggers:
+            return False
+        return (state, trigger) in self.table
+
+    def next_state(self, state, trigger):
+        """
+        Destination of trigger from state, including the to_<state> transitions which are allowed from anywhere
+        """
+        dest = self.table.get((state, trigger))
+        if dest is not None:
+            return dest
+        if trigger.startswith('to_') and trigger[3:] in self.states:
+            return trigger[3:]
+        raise FSMError(f"Can't trigger event {trigger} from state {state}!")
+
+    def is_trigger(self, name):
+        return name in self.triggers or (name.startswith('to_') and name[3:] in self.states)
+
+    def get_destination(self, transition):
+        dest = self.destinations.get(transition)
+        if dest is None:
+            raise RuntimeError(f'Transition {transition} is not a transition in your toplevelcfg.json')
+        return dest
+
+
+_fsms = {}
+_fsms_lock = threading.Lock()
+
+def get_fsm(console, fsm_type, verbose=False) -> FSM:
+    """
+    The FSM of fsm_type, built the first time it is asked for
+    """
+    key = 'timing' if fsm_type == 'timing' else 'partition'
+    with _fsms_lock:
+        fsm = _fsms.get(key)
+        if fsm is None:
+            fsm = _fsms[key] = FSM(console, fsm_type)
+    if verbose:
+        fsm.print_info(console)
+    return fsm
@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# default period (in seconds) at which a subsystem probes its applications
+DEFAULT_HEALTH_INTERVAL = 2
+
+class AppHealth:
+    """
+    Liveness of an application at a given time
+
+    alive is whether the process is running, ping whether its command port accepts connections
+    """
+
+    def __init__(self, alive: bool, ping: bool, timestamp: float = None):
+        self.alive = alive
+        self.ping = ping
+        self.timestamp = timestamp if timestamp is not None else time.monotonic()
+
+    def responsive(self) -> bool:
+        return self.alive and self.ping
+
+    def age(self) -> float:
+        return time.monotonic() - self.timestamp
+
+    def __repr__(self):
+        return f'AppHealth(alive={self.alive}, ping={self.ping}, age={self.age():.1f}s)'
+
+
+def probe_app(sup) -> AppHealth:
+    """
+    Check an application by hand, don't bother pinging it if the process is dead
+    """
+    alive = sup.desc.proc.is_alive()
+    ping = sup.commander.ping() if alive else False
+    return AppHealth(alive, ping)
+
+
+class AppHealthMonitor(threading.Thread):
+    """
+    Probes the applications of a subsystem in the background and keeps a snapshot of their liveness
+
+    All the applications are probed concurrently every `interval` seconds,
+    callers read the snapshot (or ask for a fresh probe) instead of probing inline
+    """
+
+    def __init__(self, name: str, interval: float = DEFAULT_HEALTH_INTERVAL, concurrency: int = 32):
+        threading.Thread.__init__(self, name=f'{name}-health', daemon=True)
+        self.log = logging.getLogger(f'{name}-health')
+        self.interval = interval
+        self.concurrency = concurrency
+        self.sups = {}
+        self.snapshot = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'{name}-probe')
+
+    def watch(self, sup) -> None:
+        with self.lock:
+            self.sups[sup.desc.name] = sup
+
+    def unwatch(self, name: str) -> None:
+        with self.lock:
+            self.sups.pop(name, None)
+            self.snapshot.pop(name, None)
+
+    def notify_exit(self, name: str, exit_code: int) -> None:
+        """
+        An application exited: mark it dead right away instead of waiting for the next probe
+        """
+        with self.lock:
+            if name not in self.sups: return
+            previous = self.snapshot.get(name)
+            if previous is None or previous.alive:
+                self.log.warning(f'{name} exited (exit code: {exit_code})')
+            self.snapshot[name] = AppHealth(False, False)
+
+    def _probe(self, names) -> dict:
+        with self.lock:
+            sups = {n: self.sups[n] for n in names if n in self.sups}
+
+        results = None
+        if len(sups) > 1 and not self.stop_event.is_set():
+            try:
+                futures = {n: self.pool.submit(self._probe_one, sup) for n, sup in sups.items()}
+                results = {n: f.result() for n, f in futures.items()}
+            except RuntimeError: # the pool got shut down under our feet
+                pass
+        if results is None:
+            results = {n: self._probe_one(sup) for n, sup in sups.items()}
+
+        with self.lock:
+            for n, health in results.items():
+                if n not in self.sups: continue # unwatched while we were probing
+                previous = self.snapshot.get(n)
+                if previous and previous.responsive() and not health.responsive():
+                    self.log.warning(f'{n} stopped responding (alive: {health.alive}, ping: {health.ping})')
+                self.snapshot[n] = health
+        return results
+
+    def _probe_one(self, sup) -> AppHealth:
+        try:
+            return probe_app(sup)
+        except Exception as e:
+            self.log.error(f'Couldn\'t probe {sup.desc.name}: {str(e)}')
+            return AppHealth(False, False)
+
+    def refresh(self, names=None) -> dict:
+        """
+        Probe the applications now (all of them if names is None) and update the snapshot
+        """
+        if names is None:
+            with self.lock:
+                names = list(self.sups.keys())
+        return self._probe(names)
+
+    def get(self, name: str, fresh: bool = False) -> AppHealth:
+        """
+        Latest known liveness of an application, probed on the spot if asked for or never seen
+        """
+        with self.lock:
+            health = self.snapshot.get(name)
+        if fresh or health is None:
+            health = self.refresh([name]).get(name, health)
+        return health
+
+    def run(self):
+        while not self.stop_event.is_set():
+            start = time.monotonic()
+            self.refresh()
+            self.log.debug(f'Probed {len(self.snapshot)} applications in {(time.monotonic()-start)*1000:.1f} ms')
+            self.stop_event.wait(self.interval)
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.pool.shutdown(wait=False)
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
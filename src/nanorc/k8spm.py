@@ -7,13 +7,64 @@ import time
 import json
 import copy as cp
 import os
+import base64
+import hashlib
+import threading
 from urllib.parse import urlparse
-from kubernetes import client, config
+from kubernetes import client, config, watch
+from kubernetes.client.rest import ApiException
+from concurrent.futures import ThreadPoolExecutor
 from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeRemainingColumn, TimeElapsedColumn, track
+from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeRemainingColumn, TimeElapsedColumn
 from rich.table import Table
 
 
+# how many pods/services are created at once by default
+DEFAULT_K8S_PARALLEL = 16
+# how long (in seconds) the pods get to stop on terminate
+POD_GRACE_PERIOD = 5
+# how long (in seconds) a namespace gets to finalise in the background
+NAMESPACE_DELETION_TIMEOUT = 120
+# how long (in seconds) the pod cache is waited on for its first list of the pods
+POD_CACHE_SYNC_TIMEOUT = 10
+# label of the pods pre-pulling the images
+PREPULL_LABEL = 'nanorc-prepull'
+# how long (in seconds) the images get to be pre-pulled, the pods pull what isn't there by then
+PREPULL_TIMEOUT = 120
+# labels of the pods of the warm pool: idle/bound, and the hash of what they can run
+WARM_LABEL = 'nanorc-warm'
+PROFILE_LABEL = 'nanorc-profile'
+
+
+def random_string(N:int=5):
+    import string
+    import random
+    return ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(N))
+
+
+def warm_pod_script(rte_script: str) -> str:
+    """
+    What a pod of the warm pool runs: source the RTE once, then run the apps it gets assigned one after the other
+
+    An assignment is a script written to /tmp/nanorc-assign (the first one can come in $NANORC_ASSIGNMENT),
+    it runs in a subshell so what it exports (and sources again on top) doesn't outlive its app.
+    If the app stops without being recycled, the pod exits with its exit code, like a normal app pod.
+    """
+    return '\n'.join([
+        f'source {rte_script}',
+        'if [ -n "$NANORC_ASSIGNMENT" ]; then echo "$NANORC_ASSIGNMENT" | base64 -d > /tmp/nanorc-assign; fi',
+        'unset NANORC_ASSIGNMENT',
+        'while true; do',
+        '  while [ ! -f /tmp/nanorc-assign ]; do sleep 0.2; done',
+        '  mv /tmp/nanorc-assign /tmp/nanorc-run; rm -f /tmp/nanorc-recycle',
+        '  ( source /tmp/nanorc-run ) & pid=$!',
+        '  echo $pid > /tmp/nanorc-app.pid',
+        '  wait $pid; code=$?',
+        '  rm -f /tmp/nanorc-app.pid',
+        '  [ -f /tmp/nanorc-recycle ] || exit $code',
+        'done',
+    ])
+
 class AppProcessDescriptor(object):
     """docstring for AppProcessDescriptor"""
 
@@ -25,11 +76,174 @@ class AppProcessDescriptor(object):
         self.conf = None
         self.port = None
         self.proc = None
+        self.pod_name = None
 
 
     def __str__(self):
         return str(vars(self))
 
+class PodCache(threading.Thread):
+    """
+    The pods of a namespace, keyed by their app label and kept up to date by a watch
+
+    The pods are listed once, then only the changes come from the API server,
+    however often the cache is read. Reading waits (up to sync_timeout) for that first list,
+    so a pod that exists isn't reported missing just because the cache has just started.
+    """
+
+    def __init__(self, core_v1_api, namespace: str, watch_timeout: int = 60, sync_timeout: float = POD_CACHE_SYNC_TIMEOUT):
+        threading.Thread.__init__(self, name=f'{namespace}-pods', daemon=True)
+        self.log = logging.getLogger(f'{__name__}.pods')
+        self.api = core_v1_api
+        self.namespace = namespace
+        self.watch_timeout = watch_timeout
+        self.sync_timeout = sync_timeout
+        self.pods = {}
+        self.changed = threading.Condition()
+        self.synced = threading.Event()
+        self.sync_timed_out = False
+        self.stop_event = threading.Event()
+        self.watch = None
+
+    def wait_synced(self) -> bool:
+        # only the first read waits the whole timeout if the list never comes
+        if self.synced.is_set() or self.sync_timed_out:
+            return self.synced.is_set()
+        if not self.synced.wait(self.sync_timeout):
+            self.sync_timed_out = True
+            self.log.warning(f'The pods of {self.namespace} haven\'t been listed after {self.sync_timeout} s, answering from an incomplete cache')
+            return False
+        return True
+
+    def get(self, app: str):
+        self.wait_synced()
+        with self.changed:
+            return self.pods.get(app)
+
+    def all(self) -> list:
+        self.wait_synced()
+        with self.changed:
+            return list(self.pods.values())
+
+    def wait_for_change(self, timeout: float) -> None:
+        with self.changed:
+            self.changed.wait(timeout)
+
+    def _relist(self) -> str:
+        pods = self.api.list_namespaced_pod(self.namespace, label_selector='app')
+        with self.changed:
+            self.pods = {pod.metadata.labels['app']: pod for pod in pods.items}
+            self.changed.notify_all()
+        self.synced.set()
+        return pods.metadata.resource_version
+
+    def _update(self, kind: str, pod) -> None:
+        app = (pod.metadata.labels or {}).get('app')
+        if app is None:
+            return
+        with self.changed:
+            if kind == 'DELETED':
+                self.pods.pop(app, None)
+            else:
+                self.pods[app] = pod
+            self.changed.notify_all()
+
+    def run(self):
+        resource_version = None
+        while not self.stop_event.is_set():
+            try:
+                if resource_version is None:
+                    resource_version = self._relist()
+                self.watch = watch.Watch()
+                for event in self.watch.stream(
+                        self.api.list_namespaced_pod,
+                        self.namespace,
+                        label_selector = 'app',
+                        resource_version = resource_version,
+                        timeout_seconds = self.watch_timeout):
+                    if event['type'] == 'ERROR':
+                        # most likely 410 Gone: our resource version is too old, start again from a list
+                        resource_version = None
+                        break
+                    pod = event['object']
+                    resource_version = pod.metadata.resource_version
+                    self._update(event['type'], pod)
+            except ApiException as e:
+                if e.status != 410:
+                    self.log.error(f'Watch of the pods in {self.namespace} failed: {str(e)}')
+                    self.stop_event.wait(1)
+                resource_version = None
+            except Exception as e:
+                if self.stop_event.is_set(): break
+                self.log.error(f'Watch of the pods in {self.namespace} failed: {str(e)}')
+                self.stop_event.wait(1)
+                resource_version = None
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.watch:
+            self.watch.stop()
+
+
+class NamespaceReaper(threading.Thread):
+    """
+    Waits in the background for a deleted namespace to be finalised, so terminate doesn't have to
+
+    A boot reusing the namespace waits on its reaper, and only on it.
+    """
+
+    reapers = {}
+    reapers_lock = threading.Lock()
+
+    def __init__(self, core_v1_api, namespace: str, timeout: int = NAMESPACE_DELETION_TIMEOUT):
+        threading.Thread.__init__(self, name=f'{namespace}-reaper', daemon=True)
+        self.log = logging.getLogger(f'{__name__}.reaper')
+        self.api = core_v1_api
+        self.namespace = namespace
+        self.timeout = timeout
+        self.done = threading.Event()
+
+    @classmethod
+    def reap(cls, core_v1_api, namespace: str):
+        reaper = cls(core_v1_api, namespace)
+        with cls.reapers_lock:
+            cls.reapers[namespace] = reaper
+        reaper.start()
+        return reaper
+
+    @classmethod
+    def wait_for(cls, namespace: str, timeout: float = None) -> bool:
+        """
+        Wait for the namespace to be gone if it is being reaped, returns False on timeout
+        """
+        with cls.reapers_lock:
+            reaper = cls.reapers.get(namespace)
+        if reaper is None:
+            return True
+        return reaper.done.wait(timeout)
+
+    def run(self):
+        start = time.monotonic()
+        try:
+            while time.monotonic() - start < self.timeout:
+                try:
+                    self.api.read_namespace(self.namespace)
+                except ApiException as e:
+                    if e.status == 404:
+                        self.log.info(f'Namespace "{self.namespace}" finalised in {time.monotonic()-start:.1f} s')
+                        return
+                    raise
+                time.sleep(1)
+            self.log.warning(f'Namespace "{self.namespace}" still there {self.timeout} s after being deleted')
+        except Exception as e:
+            self.log.error(f'Couldn\'t follow the deletion of namespace "{self.namespace}": {str(e)}')
+        finally:
+            with self.reapers_lock:
+                if self.reapers.get(self.namespace) is self:
+                    del self.reapers[self.namespace]
+            self.done.set()
+
+
 class K8sProcess(object):
 
     def __init__(self, pm, name, namespace):
@@ -37,19 +251,21 @@ class K8sProcess(object):
         self.name = name
         self.namespace = namespace
 
+    def pod(self):
+        return self.pm.pod_cache.get(self.name) if self.pm.pod_cache else None
+
     def is_alive(self):
-        try:
-            s = self.pm._core_v1_api.read_namespaced_pod_status(self.name, self.namespace)
-            for cond in s.status.conditions:
-                if cond.type == "Ready" and cond.status == "True":
-                    return True
-            return False
-        except:
+        s = self.pod()
+        if s is None or not s.status.conditions:
             return False
+        for cond in s.status.conditions:
+            if cond.type == "Ready" and cond.status == "True":
+                return True
+        return False
 
     def status(self):
         try:
-            s = self.pm._core_v1_api.read_namespaced_pod_status(self.name, self.namespace)
+            s = self.pod()
             container_status = s.status.container_statuses[0].state
             if   container_status.running:
                 return "Running"
@@ -65,11 +281,14 @@ class K8sProcess(object):
 
 
 class K8SProcessManager(object):
-    def __init__(self, console: Console, cluster_config, connections, log_path=None):
+    def __init__(self, console: Console, cluster_config, connections, log_path=None, parallel=DEFAULT_K8S_PARALLEL, warm_pool=False, prepull=False):
         """A Kubernetes Process Manager
 
         Args:
             console (Console): Description
+            parallel (int): how many pods are created at once
+            warm_pool (bool): run the apps in pods that are kept (and reused by the next boots) on terminate
+            prepull (bool): pull the images on the nodes the apps are pinned to before creating the pods
         """
         super(K8SProcessManager, self).__init__()
         self.log = logging.getLogger(__name__)
@@ -80,6 +299,13 @@ class K8SProcessManager(object):
         self.apps = {}
         self.partition = None
         self.cluster_config = cluster_config
+        self.pod_cache = None
+        self.parallel = parallel
+        self.warm_pool = warm_pool
+        self._exec_api = None
+        self.prepull = prepull
+        # only relaxed for the apps whose image was pre-pulled on their nodes (app_boot_info['image_pull_policy'])
+        self.image_pull_policy = "Always"
 
         config.load_kube_config()
 
@@ -113,8 +339,7 @@ class K8SProcessManager(object):
         env_vars = script_data["env"]
         cmd =';'.join([ f"export {n}=\"{v}\"" for n,v in env_vars.items()])
         cmd += ";"+"; ".join(script_data['cmd'])
-        pods = self.list_pods(self.partition)
-        hosts = set([self.get_pod_node(pod.metadata.name, self.partition) for pod in pods.items])
+        hosts = set([pod.spec.node_name for pod in self.pod_cache.all() if pod.spec.node_name])
 
         for host in hosts:
             self.log.info(f'Executing {script_data["cmd"]} on {host}.')
@@ -139,9 +364,31 @@ class K8SProcessManager(object):
         return ret
 
     # ----
+    def read_namespace(self, namespace: str):
+        """
+        The namespace, None if it doesn't exist
+        """
+        try:
+            return self._core_v1_api.read_namespace(namespace)
+        except ApiException as e:
+            if e.status == 404:
+                return None
+            raise
+
     def create_namespace(self, namespace : str):
-        nslist = [ns.metadata.name for ns in self._core_v1_api.list_namespace().items]
-        if namespace in nslist:
+        ns = self.read_namespace(namespace)
+        if ns is not None and ns.status.phase == 'Terminating':
+            # a namespace can't be reused before it's finalised, that's the only thing we need to wait for
+            self.log.info(f"Waiting for the previous \"{namespace}\" namespace to be deleted")
+            if not NamespaceReaper.wait_for(namespace, NAMESPACE_DELETION_TIMEOUT):
+                raise RuntimeError(f"Namespace \"{namespace}\" is still being deleted")
+            start = time.monotonic()
+            while ns is not None and time.monotonic() - start < NAMESPACE_DELETION_TIMEOUT:
+                time.sleep(1)
+                ns = self.read_namespace(namespace)
+            if ns is not None:
+                raise RuntimeError(f"Namespace \"{namespace}\" is still being deleted")
+        if ns is not None:
             self.log.debug(f"Not creating \"{namespace}\" namespace as it already exist")
             return
 
@@ -160,9 +407,12 @@ class K8SProcessManager(object):
 
     # ----
     def delete_namespace(self, namespace: str):
-        nslist = [ns.metadata.name for ns in self._core_v1_api.list_namespace().items]
-        if not namespace in nslist:
-            self.log.debug(f"Not deleting \"{namespace}\" namespace as it already exist")
+        ns = self.read_namespace(namespace)
+        if ns is None:
+            self.log.debug(f"Not deleting \"{namespace}\" namespace as it doesn't exist")
+            return
+        if ns.status.phase == 'Terminating':
+            self.log.debug(f"Not deleting \"{namespace}\" namespace as it is already terminating")
             return
         self.log.info(f"Deleting \"{namespace}\" namespace")
         try:
@@ -174,12 +424,14 @@ class K8SProcessManager(object):
             self.log.error(e)
             raise RuntimeError(f"Failed to delete namespace \"{namespace}\"") from e
 
-    def get_pod_node(self, pod_name, partition):
-        pod_list = self._core_v1_api.list_namespaced_pod(partition)
-        for pod in pod_list.items:
-            if pod.metadata.name == pod_name:
-                return pod.spec.node_name
-        return 'unknown'
+    def get_pod_node(self, app_name):
+        """
+        The node the pod of app_name runs on, 'unknown' if it isn't scheduled (yet)
+        """
+        pod = self.pod_cache.get(app_name) if self.pod_cache else None
+        if pod is None or not pod.spec.node_name:
+            return 'unknown'
+        return pod.spec.node_name
 
     def get_container_port_list_from_connections(self, app_name:str, connections:list=None, cmd_port:int=3333):
         ret = [
@@ -347,9 +599,12 @@ class K8SProcessManager(object):
             app_label: str,
             app_boot_info:dict,
             namespace: str,
-            run_as: dict = None):
+            run_as: dict = None,
+            pod_name: str = None,
+            extra_labels: dict = None):
 
-        info_str  = f"Creating \"{namespace}:{name}\" DAQ App"
+        pod_name = pod_name or name
+        info_str  = f"Creating \"{namespace}:{pod_name}\" DAQ App"
         debug_str = f"image: \"{app_boot_info['image']}\""
         if app_boot_info['resources']:
             debug_str += f' resources: {app_boot_info["resources"]}'
@@ -372,8 +627,8 @@ class K8SProcessManager(object):
             # Run the pod with same user id and group id as the current user
             # Required in kind environment to create non-root files in shared folders
             metadata = client.V1ObjectMeta(
-                name=name,
-                labels={"app": app_label}
+                name=pod_name,
+                labels={"app": app_label, **(extra_labels or {})}
             ),
             spec = client.V1PodSpec(
                 restart_policy = "Never",
@@ -393,7 +648,7 @@ class K8SProcessManager(object):
                     client.V1Container(
                         name = "daq-application",
                         image = app_boot_info["image"],
-                        image_pull_policy= "Always",
+                        image_pull_policy= app_boot_info.get('image_pull_policy', self.image_pull_policy),
                         security_context = client.V1SecurityContext(
                             privileged = app_boot_info['privileged'],
                             capabilities = client.V1Capabilities(
@@ -457,8 +712,11 @@ class K8SProcessManager(object):
             )
         except Exception as e:
             self.log.error(e)
-            raise RuntimeError(f"Failed to create daqapp pod \"{namespace}:{name}\"") from e
+            raise RuntimeError(f"Failed to create daqapp pod \"{namespace}:{pod_name}\"") from e
+
+        self.create_daqapp_service(name, app_label, app_boot_info, namespace)
 
+    def create_daqapp_service(self, name: str, app_label: str, app_boot_info: dict, namespace: str):
         service = client.V1Service(
             metadata = client.V1ObjectMeta(name=name),
             spec = client.V1ServiceSpec(
@@ -474,6 +732,183 @@ class K8SProcessManager(object):
             self.log.error(e)
             raise RuntimeError(f"Failed to create daqapp service \"{namespace}:{name}\"") from e
 
+    # ----
+    def prepull_images(self, images: list, node_selection: list, namespace: str, timeout: int = PREPULL_TIMEOUT) -> bool:
+        """
+        Pull the images with a short lived DaemonSet (one init container per image), showing the progress per node
+
+        Args:
+            images (list): the images to pull
+            node_selection (list): the strict node-selection entries of the apps, the DaemonSet
+                only runs on the nodes matching one of them
+            timeout (int): how long to wait for the pulls, in seconds
+
+        Returns:
+            bool: whether all the selected nodes have all the images
+        """
+        name = f'nanorc-prepull-{random_string()}'
+        labels = {PREPULL_LABEL: name}
+        # the terms of a required node affinity are ORed
+        node_affinity = client.V1NodeAffinity(
+            required_during_scheduling_ignored_during_execution = client.V1NodeSelector(
+                node_selector_terms = [
+                    client.V1NodeSelectorTerm(
+                        match_expressions = [
+                            {'key': key, 'operator': 'In', 'values': values}
+                            for key, values in selection.items() if key != 'strict'
+                        ]
+                    ) for selection in node_selection
+                ]
+            )
+        )
+        ds = client.V1DaemonSet(
+            metadata = client.V1ObjectMeta(name=name, labels=labels),
+            spec = client.V1DaemonSetSpec(
+                selector = client.V1LabelSelector(match_labels=labels),
+                template = client.V1PodTemplateSpec(
+                    metadata = client.V1ObjectMeta(labels=labels),
+                    spec = client.V1PodSpec(
+                        termination_grace_period_seconds = 0,
+                        affinity = client.V1Affinity(node_affinity=node_affinity),
+                        init_containers = [
+                            client.V1Container(
+                                name = f'pull-{i}',
+                                image = image,
+                                image_pull_policy = "Always",
+                                command = ['/bin/sh', '-c', 'true'],
+                            ) for i, image in enumerate(images)
+                        ],
+                        containers = [
+                            client.V1Container(
+                                name = 'pulled',
+                                image = images[0],
+                                image_pull_policy = "IfNotPresent",
+                                command = ['/bin/sh', '-c', 'sleep 3600'],
+                            )
+                        ],
+                    )
+                )
+            )
+        )
+
+        self.log.info(f'Pre-pulling {len(images)} image(s) on the nodes of the apps (at most {timeout} s): {images}')
+        try:
+            self._apps_v1_api.create_namespaced_daemon_set(namespace, ds)
+        except Exception as e:
+            self.log.error(f'Couldn\'t create the image pre-pull DaemonSet, the pods will pull their images: {str(e)}')
+            return False
+
+        start = time.monotonic()
+        pulled = {}
+        failed = {}
+        expected = 0
+        try:
+            with Progress(
+                SpinnerColumn(),
+                TextColumn("[progress.description]{task.description}"),
+                BarColumn(),
+                TextColumn("{task.completed}/{task.total} images"),
+                TimeElapsedColumn(),
+                console=self.console,
+            ) as progress:
+                nodes = {}
+                while time.monotonic() - start < timeout:
+                    status = self._apps_v1_api.read_namespaced_daemon_set(name, namespace).status
+                    for pod in self._core_v1_api.list_namespaced_pod(namespace, label_selector=f'{PREPULL_LABEL}={name}').items:
+                        node = pod.spec.node_name
+                        if not node: continue
+                        if node not in nodes:
+                            nodes[node] = progress.add_task(f'[blue]{node}', total=len(images))
+                        statuses = pod.status.init_container_statuses or []
+                        done = sum(1 for s in statuses if s.state.terminated and s.state.terminated.exit_code == 0)
+                        errors = [s.state.waiting.reason for s in statuses if s.state.waiting and s.state.waiting.reason in ['ErrImagePull', 'ImagePullBackOff', 'InvalidImageName']]
+                        progress.update(nodes[node], completed=done)
+                        if done == len(images) and node not in pulled:
+                            pulled[node] = time.monotonic() - start
+                        if errors and node not in failed:
+                            failed[node] = errors[0]
+                            progress.update(nodes[node], description=f'[red]{node} ({errors[0]})')
+
+                    expected = status.desired_number_scheduled or 0
+                    if expected and len(pulled) + len(failed) >= expected:
+                        break
+                    time.sleep(1)
+        finally:
+            try:
+                self._apps_v1_api.delete_namespaced_daemon_set(name, namespace, propagation_policy='Background')
+            except Exception as e:
+                self.log.error(f'Couldn\'t delete the image pre-pull DaemonSet: {str(e)}')
+
+        for node, t in sorted(pulled.items(), key=lambda i: i[1]):
+            self.log.debug(f'Images pulled on {node} in {t:.1f} s')
+        if pulled:
+            slowest = max(pulled, key=pulled.get)
+            self.log.info(f'Images pulled on {len(pulled)} node(s) in {time.monotonic()-start:.1f} s (slowest: {slowest}, {pulled[slowest]:.1f} s)')
+        if failed:
+            self.log.error(f'Couldn\'t pull the images on {len(failed)} node(s): '+', '.join(f'{n} ({r})' for n, r in failed.items()))
+        if not pulled or failed or len(pulled) < expected:
+            self.log.warning('The images aren\'t on all the nodes, the pods will pull them')
+            return False
+        return True
+
+    def exec_in_pod(self, pod_name: str, namespace: str, script: str) -> str:
+        """
+        Run a bash script in a pod, raises if it didn't succeed
+        """
+        from kubernetes.stream import stream
+        if self._exec_api is None:
+            # stream() swaps the request function of the client it uses, so it gets its own
+            self._exec_api = client.CoreV1Api(client.ApiClient())
+        out = stream(
+            self._exec_api.connect_get_namespaced_pod_exec, pod_name, namespace,
+            command = ['/bin/bash', '-c', script+' && echo NANORC_EXEC_OK'],
+            stderr = True, stdin = False,
+            stdout = True, tty = False
+        )
+        if 'NANORC_EXEC_OK' not in out:
+            raise RuntimeError(f'Script failed in pod \"{namespace}:{pod_name}\": {out.strip()}')
+        return out
+
+    def idle_warm_pods(self, namespace: str) -> dict:
+        """
+        The running idle pods of the warm pool, as profile -> [pod names]
+        """
+        idle = {}
+        for pod in self._core_v1_api.list_namespaced_pod(namespace, label_selector=f'{WARM_LABEL}=idle').items:
+            if pod.status.phase == 'Running' and not pod.metadata.deletion_timestamp:
+                idle.setdefault(pod.metadata.labels.get(PROFILE_LABEL), []).append(pod.metadata.name)
+        return idle
+
+    def bind_warm_pod(self, pod_name: str, app_label: str, app_boot_info: dict, namespace: str):
+        self.log.info(f"Binding \"{namespace}:{app_label}\" DAQ App to warm pod \"{pod_name}\"")
+        assignment = app_boot_info['env']['NANORC_ASSIGNMENT']
+        self.exec_in_pod(
+            pod_name, namespace,
+            f'echo {assignment} | base64 -d > /tmp/nanorc-assign.tmp && mv /tmp/nanorc-assign.tmp /tmp/nanorc-assign'
+        )
+        self._core_v1_api.patch_namespaced_pod(pod_name, namespace, {'metadata': {'labels': {'app': app_label, WARM_LABEL: 'bound'}}})
+        self.create_daqapp_service(app_label, app_label, app_boot_info, namespace)
+
+    def recycle_warm_pod(self, pod_name: str, namespace: str):
+        """
+        Stop the app of a warm pod and put the pod back in the pool, delete it if that doesn't work
+        """
+        try:
+            self.exec_in_pod(pod_name, namespace, '\n'.join([
+                'touch /tmp/nanorc-recycle',
+                'pid=$(cat /tmp/nanorc-app.pid 2>/dev/null) || true',
+                'if [ -n "$pid" ]; then',
+                '  kill -TERM $pid',
+                f'  for i in $(seq {POD_GRACE_PERIOD*10}); do [ -f /tmp/nanorc-app.pid ] || break; sleep 0.1; done',
+                '  [ -f /tmp/nanorc-app.pid ] && kill -KILL $pid',
+                'fi',
+                'true',
+            ]))
+            self._core_v1_api.patch_namespaced_pod(pod_name, namespace, {'metadata': {'labels': {'app': None, WARM_LABEL: 'idle'}}})
+        except Exception as e:
+            self.log.warning(f"Couldn\'t recycle warm pod \"{namespace}:{pod_name}\", deleting it: {str(e)}")
+            self._core_v1_api.delete_namespaced_pod(pod_name, namespace, grace_period_seconds=POD_GRACE_PERIOD)
+
     # ----
     def create_nanorc_responder(self, name: str, namespace: str, ip: str, port: int):
 
@@ -670,6 +1105,9 @@ class K8SProcessManager(object):
         # Create partition
         self.create_namespace(self.partition)
 
+        self.pod_cache = PodCache(self._core_v1_api, self.partition)
+        self.pod_cache.start()
+
         run_as = {
             'uid': os.getuid(),
             'gid': os.getgid(),
@@ -686,6 +1124,7 @@ class K8SProcessManager(object):
             'physical_location': log_dir
         }]
 
+        to_create = []
         for app_name in boot_info['order']:
             app_conf = apps[app_name]
             cmd_port = app_conf['port']
@@ -795,6 +1234,27 @@ class K8SProcessManager(object):
                 app_boot_info["affinity"] = None
                 app_boot_info["anti-affinity"] = None
 
+            profile = None
+            if self.warm_pool:
+                # the app env and command come with the assignment, everything else is fixed when the pod is created
+                pod_env = strip_env_for_rte(env_vars)
+                profile = hashlib.sha1(json.dumps({
+                    'env': pod_env,
+                    'rte_script': rte_script,
+                    'run_as': run_as,
+                    **{k: app_boot_info[k] for k in ['image', 'mounted_dirs', 'resources', 'affinity', 'anti-affinity', 'node-selection', 'privileged', 'capabilities']},
+                }, sort_keys=True, default=str).encode()).hexdigest()[:16]
+                # like in a cold pod, the app env is exported before the RTE is sourced: the pod sourced
+                # it with the partition env, it's only sourced again if the app env has more than that
+                exports = [f'export {n}=\"{v}\"' for n, v in app_boot_info['env'].items() if pod_env.get(n) != v]
+                assignment = '\n'.join(
+                    exports +
+                    ([f'source {rte_script}'] if exports else []) +
+                    [f'exec {app_cmd} {" ".join(app_args)} > >(tee /logs/{log_file}) 2>&1']
+                )
+                app_boot_info['env'] = {**pod_env, 'NANORC_ASSIGNMENT': base64.b64encode(assignment.encode()).decode()}
+                app_boot_info['args'] = [warm_pod_script(rte_script)]
+
             self.log.debug(json.dumps(app_boot_info, indent=2))
             app_desc = AppProcessDescriptor(app_name)
             app_desc.conf = app_conf.copy()
@@ -805,18 +1265,61 @@ class K8SProcessManager(object):
             app_desc.proc = K8sProcess(self, app_name, self.partition)
 
             k8s_name = app_name#.replace("_", "-").replace(".", "")
-
-            self.create_daqapp_pod(
-                name = k8s_name, # better kwargs all this...
-                app_label = k8s_name,
-                app_boot_info = app_boot_info,
-                namespace = self.partition,
-                run_as = run_as
-            )
-
-            app_desc.node = self.get_pod_node(k8s_name, self.partition)
-
-            self.apps[app_name] = app_desc
+            to_create.append((app_desc, k8s_name, app_boot_info, profile))
+
+        if self.prepull and to_create:
+            # only the apps pinned to nodes: the others can land anywhere, so they pull their images themselves
+            pinned = []
+            node_selection = []
+            for _, _, app_boot_info, _ in to_create:
+                strict = [sel for sel in (app_boot_info['node-selection'] or []) if sel.get('strict')]
+                if strict:
+                    pinned.append(app_boot_info)
+                    node_selection += [sel for sel in strict if sel not in node_selection]
+            if pinned:
+                images = sorted({app_boot_info['image'] for app_boot_info in pinned})
+                if self.prepull_images(images, node_selection, self.partition):
+                    for app_boot_info in pinned:
+                        app_boot_info['image_pull_policy'] = "IfNotPresent"
+            else:
+                self.log.info('None of the apps is pinned to nodes, not pre-pulling their images')
+
+        idle = self.idle_warm_pods(self.partition) if self.warm_pool else {}
+        if self.warm_pool:
+            self.log.info(f'{sum(len(p) for p in idle.values())} idle pods in the warm pool')
+
+        # the specs are ready, the API round trips are what takes time, so they are done concurrently
+        # (the node of each app is only known once its pod is scheduled, it's filled in below)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, min(self.parallel, len(to_create))), thread_name_prefix='k8spm') as pool:
+            futures = []
+            for app_desc, k8s_name, app_boot_info, profile in to_create:
+                if self.warm_pool and idle.get(profile):
+                    app_desc.pod_name = idle[profile].pop()
+                    futures.append(pool.submit(self.bind_warm_pod, app_desc.pod_name, k8s_name, app_boot_info, self.partition))
+                    continue
+                app_desc.pod_name = f'{k8s_name}-warm-{random_string()}' if self.warm_pool else k8s_name
+                futures.append(pool.submit(
+                    self.create_daqapp_pod,
+                    name = k8s_name, # better kwargs all this...
+                    app_label = k8s_name,
+                    app_boot_info = app_boot_info,
+                    namespace = self.partition,
+                    run_as = run_as,
+                    pod_name = app_desc.pod_name,
+                    extra_labels = {WARM_LABEL: 'bound', PROFILE_LABEL: profile} if self.warm_pool else None,
+                ))
+            failed = {}
+            for (app_desc, k8s_name, _, _), future in zip(to_create, futures):
+                try:
+                    future.result()
+                    self.apps[app_desc.name] = app_desc
+                except Exception as e:
+                    failed[app_desc.name] = e
+        self.log.info(f'Created {len(to_create)-len(failed)} pods in {time.perf_counter()-start:.2f} s')
+
+        if failed:
+            raise RuntimeError(f"Failed to create {len(failed)} app(s): "+', '.join(f'{name} ({str(e)}: {str(e.__cause__)})' for name, e in failed.items()))
 
         with Progress(
             SpinnerColumn(),
@@ -833,14 +1336,16 @@ class K8SProcessManager(object):
             }
             waiting = progress.add_task("[yellow]timeout", total=timeout)
 
-            for _ in range(timeout):
-                progress.update(waiting, advance=1)
+            start = time.monotonic()
+            while time.monotonic() - start < timeout:
+                progress.update(waiting, completed=time.monotonic() - start)
 
                 ready = self.check_apps()
                 for a, t in apps_tasks.items():
                     if a in ready:
                         progress.update(t, completed=1)
                         self.apps[a].pod = ready[a]
+                        self.apps[a].node = self.get_pod_node(a)
                 progress.update(total, completed=len(ready))
                 r = list(ready.keys())
                 a = list(self.apps.keys())
@@ -850,15 +1355,11 @@ class K8SProcessManager(object):
                     progress.update(waiting, visible=False)
                     break
 
-                time.sleep(1)
-
-        def rdm_string(N:int=5):
-            import string
-            import random
-            return ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(N))
+                # wakes up as soon as a pod changes
+                self.pod_cache.wait_for_change(1)
 
         self.create_nanorc_responder(
-            name = f'nanorc-{rdm_string()}',
+            name = f'nanorc-{random_string()}',
             namespace = self.partition,
             ip = self.gateway,
             port = boot_info["response_listener"]["port"])
@@ -866,32 +1367,45 @@ class K8SProcessManager(object):
     # ---
     def check_apps(self):
         ready = {}
-        for p in self._core_v1_api.list_namespaced_pod(self.partition).items:
-            for name in self.apps.keys():
-                if name in p.metadata.name and p.status.phase == "Running":
-                    ready[name]=p.metadata.name
+        for name in self.apps.keys():
+            p = self.pod_cache.get(name)
+            if p is not None and p.status.phase == "Running":
+                ready[name]=p.metadata.name
         return ready
 
     # ---
     def terminate(self):
 
-        timeout = 60
-        if self.partition:
+        if self.pod_cache:
+            self.pod_cache.stop()
+            self.pod_cache = None
+        if self.partition and self.warm_pool:
+            # the pods go back to the pool, only what is specific to this boot goes away
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=max(1, min(self.parallel, len(self.apps))), thread_name_prefix='k8spm') as pool:
+                tasks = [pool.submit(self.recycle_warm_pod, desc.pod_name, self.partition) for desc in self.apps.values()]
+                tasks += [pool.submit(self._core_v1_api.delete_namespaced_service, name, self.partition) for name in self.apps]
+                if getattr(self, 'nanorc_responder', None):
+                    tasks += [
+                        pool.submit(self._core_v1_api.delete_namespaced_service, self.nanorc_responder, self.partition),
+                        pool.submit(self._core_v1_api.delete_namespaced_endpoints, self.nanorc_responder, self.partition),
+                    ]
+                for task in tasks:
+                    try:
+                        task.result()
+                    except Exception as e:
+                        self.log.error(f"Failed to clean up \"{self.partition}\": {str(e)}")
+            self.log.info(f'Recycled {len(self.apps)} warm pods in {time.perf_counter()-start:.2f} s')
+            self.apps = {}
+        elif self.partition:
+            # the pods get a short grace period, the rest of the namespace is finalised in the background
+            try:
+                self._core_v1_api.delete_collection_namespaced_pod(self.partition, grace_period_seconds=POD_GRACE_PERIOD)
+            except Exception as e:
+                self.log.error(f"Failed to delete the pods of \"{self.partition}\": {str(e)}")
             self.delete_namespace(self.partition)
-
-            for _ in track(range(timeout), description="Terminating namespace..."):
-
-                s = self._core_v1_api.list_namespace()
-                found = False
-                for namespace in s.items:
-                    if namespace.metadata.name == self.partition:
-                        found = True
-                        break
-                if not found:
-                    return
-                time.sleep(1)
-
-            logging.warning('Timeout expired!')
+            NamespaceReaper.reap(self._core_v1_api, self.partition)
+            self.apps = {}
 
 
 # ---
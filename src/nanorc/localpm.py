@@ -0,0 +1,84 @@
+import os
+import socket
+import signal
+import subprocess
+import sh
+from rich.console import Console
+
+from .sshpm import SSHProcessManager, SSHProcess, DEFAULT_SSH_PARALLEL, DEFAULT_SSH_PER_HOST, DEFAULT_TERMINATE_GRACE
+
+
+def is_local_host(host):
+    """
+    Whether host is an address of this machine (only local addresses can be bound to)
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.bind((host, 0))
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+
+class LocalProcess(SSHProcess):
+    """
+    An application started by bash on this host, signalled as a process group so the app gets it and not only bash
+    """
+
+    def signal(self, sig):
+        if not self.is_alive():
+            return
+        try:
+            os.killpg(self.pid, sig)
+        except ProcessLookupError:
+            pass
+
+
+class LocalProcessManager(SSHProcessManager):
+    """
+    Runs the applications on this host with bash, the environment and the runtime environment script are handled like with ssh
+    """
+
+    def __init__(self, console: Console, log_path, parallel=DEFAULT_SSH_PARALLEL, per_host=DEFAULT_SSH_PER_HOST, launcher='app', grace=DEFAULT_TERMINATE_GRACE):
+        super(LocalProcessManager, self).__init__(
+            console = console,
+            log_path = log_path,
+            ssh_conf = [],
+            parallel = parallel,
+            per_host = per_host,
+            multiplex = False,
+            launcher = launcher,
+            grace = grace,
+        )
+
+    def setup_app(self, app_name, app_conf, conf_loc):
+        desc = super(LocalProcessManager, self).setup_app(app_name, app_conf, conf_loc)
+        desc.ssh_args = []
+        return desc
+
+    def count_connection(self, host):
+        pass
+
+    def ssh(self, host, *args, **kwargs):
+        """
+        Run the command (the last argument) with bash, like sh.ssh would on host
+        """
+        cmd = [a for arg in args for a in (arg if isinstance(arg, list) else [arg])][-1]
+        return sh.bash('-c', cmd, **kwargs)
+
+    def spawn(self, host, *args, stdout=subprocess.DEVNULL, preexec_fn=None):
+        popen = subprocess.Popen(
+            ["bash", "-c", args[-1]],
+            stdin = subprocess.PIPE, # like ssh, see SSHProcessManager.spawn
+            stdout = stdout,
+            stderr = subprocess.STDOUT,
+            start_new_session = True,
+            preexec_fn = preexec_fn,
+        )
+        return LocalProcess(popen)
+
+    def knock(self, host, ssh_args):
+        if not is_local_host(host):
+            raise RuntimeError(f'{host} is not this host, the local process manager can only start apps here')
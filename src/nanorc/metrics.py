@@ -0,0 +1,144 @@
+import math
+import threading
+from typing import NoReturn
+
+# upper bounds (in seconds) of the histogram buckets, the last one catches everything
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60., 120., math.inf)
+
+# name -> help of the metrics nanorc records
+METRICS = {
+    'nanorc_command_ack_seconds':     'Time between sending a command to an application and receiving the HTTP ack',
+    'nanorc_command_reply_seconds':   'Time between the HTTP ack of a command and the reply of the application',
+    'nanorc_command_total_seconds':   'Time between sending a command to an application and receiving its reply',
+    'nanorc_reply_handling_seconds':  'Time between the reply of an application arriving and the subsystem handling it',
+    'nanorc_transition_seconds':      'Time a subsystem took to send a command to its applications and collect all the replies',
+    'nanorc_socks_handshake_seconds': 'Time to open a connection to an application through the SOCKS proxy (k8s)',
+}
+
+
+class Histogram:
+    """
+    Fixed bucket histogram, observations are only counted so it never grows
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.
+        self.count = 0
+        self.max = 0.
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> NoReturn:
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.sum += value
+            self.count += 1
+            self.max = max(self.max, value)
+
+    def mean(self) -> float:
+        with self.lock:
+            return self.sum / self.count if self.count else 0.
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th quantile (the max for the overflow bucket)
+        """
+        with self.lock:
+            if not self.count:
+                return 0.
+            rank = q * self.count
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                if cumulative >= rank:
+                    return min(bound, self.max)
+            return self.max
+
+    def cumulative_counts(self) -> list:
+        with self.lock:
+            ret = []
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                ret.append((bound, cumulative))
+            return ret
+
+
+def _format_labels(labels: dict, extra: dict = None) -> str:
+    extra = extra or {}
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in items) + '}'
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+
+class MetricsRegistry:
+    """
+    Histograms of the command latencies, keyed by metric name and labels
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        if name not in METRICS:
+            raise RuntimeError(f'Unknown metric {name}')
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = Histogram()
+        return h
+
+    def get(self, name: str, **labels) -> Histogram:
+        """
+        The histogram of a metric with these labels, None if nothing was recorded
+        """
+        with self.lock:
+            return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    def observe(self, name: str, value: float, **labels) -> NoReturn:
+        self.histogram(name, **labels).observe(value)
+
+    def series(self, name: str) -> list:
+        """
+        (labels, histogram) of a metric, sorted by labels
+        """
+        with self.lock:
+            return [(dict(labels), h) for (n, labels), h in sorted(self.histograms.items(), key=lambda kv: kv[0]) if n == name]
+
+    def reset(self) -> NoReturn:
+        with self.lock:
+            self.histograms = {}
+
+    def to_prometheus(self) -> str:
+        """
+        The histograms in the Prometheus text exposition format
+        """
+        lines = []
+        for name, help in METRICS.items():
+            series = self.series(name)
+            if not series:
+                continue
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, h in series:
+                for bound, count in h.cumulative_counts():
+                    lines.append(f'{name}_bucket{_format_labels(labels, {"le": _format_bound(bound)})} {count}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {h.sum}')
+                lines.append(f'{name}_count{_format_labels(labels)} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
@@ -11,18 +11,22 @@ from rich.panel import Panel
 import copy as cp
 import logging
 from .pmdesc import PMFactory
-from .appctrl import AppSupervisor, ResponseListener, ResponseTimeout, NoResponse
+from .appctrl import AppSupervisor, ResponseListener, ResponseTimeout, NoResponse, ConnectionStats
 from typing import Union, NoReturn
-from .fsm import FSM
 import os.path
 from .statefulnode import StatefulNode, ErrorCode, CanExecuteReturnVal
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeRemainingColumn, TimeElapsedColumn
 from .utils import TaskEnqueuerThread, Task
+from .healthmon import AppHealthMonitor, DEFAULT_HEALTH_INTERVAL
+from .metrics import registry as metrics
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 
 
-log = logging.getLogger("transitions")
-log.setLevel(logging.ERROR)
+# how many applications a subsystem sends a command to at the same time
+DEFAULT_COMMAND_CONCURRENCY = 32
+# how often (in seconds) a subsystem waiting for replies checks that its applications are still alive
+LIVENESS_CHECK_INTERVAL = 1
 
 class ApplicationNode(StatefulNode):
     def __init__(self, name, sup, console, log, fsm_conf, parent=None):
@@ -63,6 +67,13 @@ class SubsystemNode(StatefulNode):
         self.pm = None
         self.pm_task_enqueuer = None
         self.listener = None
+        self.monitor = None
+
+    def connection_stats(self) -> ConnectionStats:
+        stats = ConnectionStats()
+        for c in self.children:
+            stats.merge(c.sup.commander.connection_stats)
+        return stats
 
     def can_execute_custom_or_expert(self, command, quiet=False, check_dead=True, check_inerror=True, check_children=True, only_included=True):
         ret = super().can_execute_custom_or_expert(
@@ -80,7 +91,7 @@ class SubsystemNode(StatefulNode):
             for c in self.children:
                 if not c.included and only_included: continue
 
-                if check_dead and not (c.sup.desc.proc.is_alive() and c.sup.commander.ping()):
+                if check_dead and not c.sup.is_responsive():
                     self.return_code = ErrorCode.Failed
                     self.log.error(f'{c.name} is dead, cannot send {command}')
                     return CanExecuteReturnVal.Dead
@@ -105,7 +116,7 @@ class SubsystemNode(StatefulNode):
             for c in self.children:
                 if not c.included and only_included: continue
 
-                if check_dead and not (c.sup.desc.proc.is_alive() and c.sup.commander.ping()):
+                if check_dead and not c.sup.is_responsive():
                     self.return_code = ErrorCode.Failed
                     self.log.error(f'{c.name} is dead, cannot send {command} unless you disable it or --force')
                     return CanExecuteReturnVal.Dead
@@ -115,9 +126,9 @@ class SubsystemNode(StatefulNode):
 
     def send_custom_command(self, cmd, data, timeout, app=None) -> dict:
         ret = {}
-        if not self.listener.flask_manager.is_alive():
+        if not self.listener.is_alive():
             self.log.error('Response listener is not alive, trying to respawn it!!')
-            self.listener.flask_manager = self.listener.create_manager()
+            self.listener.restart()
 
         if cmd == 'scripts': # unfortunately I don't see how else to do this
             scripts = self.cfgmgr.boot.get('scripts')
@@ -155,7 +166,7 @@ class SubsystemNode(StatefulNode):
                     else:
                         if not is_include_exclude and not c.included: continue
 
-                    if not (c.sup.desc.proc.is_alive() and c.sup.commander.ping()):
+                    if not c.sup.is_responsive():
                         self.log.error(f'{c.name} is dead, cannot send {cmd} to the app')
                         continue
 
@@ -172,7 +183,7 @@ class SubsystemNode(StatefulNode):
                 else:
                     if not is_include_exclude and not c.included: continue
 
-                if not (c.sup.desc.proc.is_alive() and c.sup.commander.ping()):
+                if not c.sup.is_responsive():
                     self.log.error(f'{c.name} is dead, cannot send {cmd} to the app')
                     continue
                 cmd_data = {
@@ -185,9 +196,9 @@ class SubsystemNode(StatefulNode):
         return ret
 
     def send_expert_command(self, app, cmd, timeout) -> dict:
-        if not self.listener.flask_manager.is_alive():
+        if not self.listener.is_alive():
             self.log.error('Response listener is not alive, trying to respawn it!!')
-            self.listener.flask_manager = self.listener.create_manager()
+            self.listener.restart()
 
         cmd_name = cmd['id']
         cmd_payload = cmd.get('data', {})
@@ -257,6 +268,15 @@ class SubsystemNode(StatefulNode):
             )
             return
 
+        self.monitor = AppHealthMonitor(
+            self.name,
+            interval = event.kwargs.get('health_interval') or DEFAULT_HEALTH_INTERVAL,
+            concurrency = event.kwargs.get('concurrency') or DEFAULT_COMMAND_CONCURRENCY,
+        )
+        if hasattr(self.pm, 'add_exit_listener'):
+            # the process manager knows as soon as an app exits, no need to wait for the next probe
+            self.pm.add_exit_listener(self.monitor.notify_exit)
+
         children = []
         failed = []
         for n,d in self.pm.apps.items():
@@ -271,17 +291,19 @@ class SubsystemNode(StatefulNode):
                 name=n,
                 console=self.console,
                 log=self.log,
-                sup=AppSupervisor(self.console, d, self.listener, response_host, proxy),
+                sup=AppSupervisor(self.console, d, self.listener, response_host, proxy, self.monitor, self.name),
                 parent=self,
                 fsm_conf=self.fsm_conf)
 
             tries=0 # give it 10 more seconds to come up
-            while (not child.sup.desc.proc.is_alive() or not child.sup.commander.ping()) and tries<20:
+            health = child.sup.health(fresh=True)
+            while not health.responsive() and tries<20:
                 time.sleep(0.5)
                 tries+=1
+                health = child.sup.health(fresh=True)
 
 
-            if child.sup.desc.proc.is_alive() and child.sup.commander.ping():
+            if health.responsive():
                 # nothing really happens in these 2:
                 child.boot()
                 child.end_boot()
@@ -294,9 +316,9 @@ class SubsystemNode(StatefulNode):
                     "error": "Not bootable",
                 })
                 etext=''
-                if not child.sup.desc.proc.is_alive():
+                if not health.alive:
                     etext='Process isn\'t alive! '
-                if not child.sup.commander.ping():
+                if not health.ping:
                     etext='Cannot ping the app!'
                 child.to_error(
                     text=etext,
@@ -306,6 +328,7 @@ class SubsystemNode(StatefulNode):
             children.append(child)
 
         self.children = children
+        self.monitor.start()
 
         status_code = ErrorCode.Success
         if failed:
@@ -346,6 +369,9 @@ class SubsystemNode(StatefulNode):
 
     def terminate_logic(self) -> NoReturn:
         self.log.debug(f"Terminate logic of {self.name}")
+        if self.monitor:
+            self.monitor.stop()
+            self.monitor = None
         if self.listener:
             self.listener.terminate()
         if self.pm:
@@ -402,9 +428,9 @@ class SubsystemNode(StatefulNode):
         appset = list(self.children)
         failed = []
 
-        if not self.listener.flask_manager.is_alive():
+        if not self.listener.is_alive():
             self.log.error('Response listener is not alive, trying to respawn it!!')
-            self.listener.flask_manager = self.listener.create_manager()
+            self.listener.restart()
 
         to_chuck = []
         for i, n in enumerate(appset):
@@ -413,7 +439,7 @@ class SubsystemNode(StatefulNode):
                 to_chuck.append(n.name)
                 continue
 
-            if not n.sup.desc.proc.is_alive() or not n.sup.commander.ping():
+            if not n.sup.is_responsive():
                 text = f"'{n.name}' seems to be dead. So I cannot initiate transition '{command}'"
                 if force:
                     self.log.error(text+f"\nBut! '--force' was specified, so I'll ignore '{n.name}'!")
@@ -435,45 +461,101 @@ class SubsystemNode(StatefulNode):
                     del appset[i]
 
         ignore = []
+        send_times = {}
+        concurrency = event.kwargs.get('concurrency') or DEFAULT_COMMAND_CONCURRENCY
+        data = self.cfgmgr.generate_data_for_module(event.kwargs.get('overwrite_data'))
+
+        def send(child_node, entry_state):
+            start = time.perf_counter()
+            child_node.sup.send_command(
+                cmd_id = command,
+                cmd_data = data,
+                entry_state = entry_state,
+                exit_state = exit_state
+            )
+            return time.perf_counter() - start
+
         with Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
             BarColumn(),
             TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
             console=self.console,
+            disable=not event.kwargs.get('progress', True),
         ) as progress:
             total = progress.add_task("[yellow]# acks      received", total=len(appset))
 
-            completed = 0
+            to_send = []
             for child_node in appset:
-                data = self.cfgmgr.generate_data_for_module(event.kwargs.get('overwrite_data'))
                 if not child_node.included:
                     self.log.info(f'Node {child_node.name} is excluded! NOT sending {command} to it!')
                     continue
-                self.log.debug(f'Sending {command} to {child_node.name}')
 
                 entry_state = child_node.state.upper()
-
                 try:
                     child_node.trigger(command)
                     ## APP now in *_ing
-                    child_node.sup.send_command(
-                        cmd_id = command,
-                        cmd_data = data,
-                        entry_state = entry_state,
-                        exit_state = exit_state
-                    )
-                    completed += 1
-                    progress.update(total, completed=completed)
-
+                    to_send.append((child_node, entry_state))
                 except Exception as e:
                     if force:
                         self.log.error(f'Failed to send \'{command}\' to \'{child_node.name}\', --force was specified so continuing anyway')
                         ignore+=[child_node.name]
                     else:
                         self.log.error(f'Failed to send \'{command}\' to \'{child_node.name}\'')
+                        # the children triggered before it are in *_ing but won't get the command
+                        child_node.to_error(command=command, exception=e)
+                        for stranded, _ in to_send:
+                            stranded.to_error(command=command, text=f'\'{command}\' was not sent as \'{child_node.name}\' failed to get it')
+                        self.to_error(command=command, exception=e)
                         raise e
 
+            # The FSM bookkeeping above is cheap, the blocking HTTP posts are
+            # what takes time, so only these are fanned out to the pool
+            completed = 0
+            send_start = time.perf_counter()
+            error = None
+            with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(to_send)))) as pool:
+                futures = {}
+                for child_node, entry_state in to_send:
+                    self.log.debug(f'Sending {command} to {child_node.name}')
+                    futures[pool.submit(send, child_node, entry_state)] = child_node
+
+                # on a failure (without --force) the sends that haven't started are cancelled,
+                # but the ones in flight are still collected so no child is left in *_ing
+                for future in as_completed(futures):
+                    child_node = futures[future]
+                    if future.cancelled():
+                        child_node.to_error(command=command, text=f'\'{command}\' was not sent as another application failed to get it')
+                        continue
+                    try:
+                        send_times[child_node.name] = future.result()
+                        completed += 1
+                        progress.update(total, completed=completed)
+
+                    except Exception as e:
+                        if force:
+                            self.log.error(f'Failed to send \'{command}\' to \'{child_node.name}\', --force was specified so continuing anyway')
+                            ignore+=[child_node.name]
+                        else:
+                            self.log.error(f'Failed to send \'{command}\' to \'{child_node.name}\'')
+                            child_node.to_error(command=command, exception=e)
+                            if error is None:
+                                error = e
+                                for pending in futures:
+                                    pending.cancel()
+
+            if error is not None:
+                self.to_error(command=command, exception=error)
+                raise error
+
+        for app_name, send_time in sorted(send_times.items(), key=lambda t: t[1], reverse=True):
+            self.log.debug(f'\'{command}\' sent to \'{app_name}\' in {send_time*1000:.1f} ms')
+        if send_times:
+            slowest = max(send_times, key=send_times.get)
+            self.log.info(f'Sent \'{command}\' to {len(send_times)} applications of {self.name} in {time.perf_counter()-send_start:.2f} s (max {concurrency} at a time, slowest: \'{slowest}\' {send_times[slowest]*1000:.1f} ms)')
+            self.log.debug(f'Connections to the applications of {self.name}: {self.connection_stats()}')
+            for tunnel in {c.sup.commander.tunnel for c in self.children if c.sup.commander.tunnel}:
+                self.log.debug(str(tunnel))
 
         for chuck in ignore:
             for i, app in enumerate(appset):
@@ -488,61 +570,79 @@ class SubsystemNode(StatefulNode):
             TimeRemainingColumn(),
             TimeElapsedColumn(),
             console=self.console,
+            disable=not event.kwargs.get('progress', True),
         ) as progress:
             n_apps = len(appset)
             total = progress.add_task("[yellow]# responses received", total = n_apps)
             apps_tasks = {
                 a.name: progress.add_task(f"[blue]{a.name}", total=1) for a in appset
             }
-            timeout_bar = progress.add_task("[yellow]timeout", total = timeout*10)
+            timeout_bar = progress.add_task("[yellow]timeout", total = timeout)
 
-            for _ in range(timeout*10):
-                progress.update(timeout_bar, advance=1)
+            # each reply resolves the future of its app, so we only wake up when
+            # something comes back, or periodically to check that the apps are still alive
+            waiting = {
+                child_node.sup.response_future(): child_node
+                for child_node in appset if child_node.included
+            }
+            start = time.monotonic()
+            deadline = start + timeout
+            next_liveness_check = start + LIVENESS_CHECK_INTERVAL
 
-                if len(appset)==0:
-                    progress.update(total, completed = n_apps)
-                    progress.update(timeout_bar, visible=False)
+            while waiting:
+                now = time.monotonic()
+                if now >= deadline:
                     break
-                done = []
-                for child_node in appset:
-                    if not child_node.included: continue
-
-                    if not child_node.sup.desc.proc.is_alive() or not child_node.sup.commander.ping():
-                        failed.append(child_node.name)
-                        child_node.to_error(
-                            command = command,
-                        )
-                        done += [child_node]
-                        break
 
-                    try:
-                        r = child_node.sup.check_response()
-                    except NoResponse:
-                        continue
+                replied, _ = wait(
+                    waiting,
+                    timeout = min(deadline, next_liveness_check) - now,
+                    return_when = FIRST_COMPLETED
+                )
 
-                    done += [child_node]
+                for future in replied:
+                    child_node = waiting.pop(future)
+                    r = child_node.sup.check_response()
+                    reply_time = child_node.sup.commander.reply_time
+                    if reply_time is not None:
+                        metrics.observe('nanorc_reply_handling_seconds', time.perf_counter() - reply_time, subsystem=self.name, command=command)
                     if r['success']:
                         child_node.trigger("end_"+command) # this is all dummy
                     else:
-                        response = {
-                            "node": child_node.name,
-                            "status_code" : r,
-                            "state": child_node.state,
-                            "command": command,
-                            "error": r,
-                        }
                         failed.append(child_node.name)
                         child_node.to_error(
                             command=command,
                             text=r['result']
                         )
+                    progress.update(apps_tasks[child_node.name], completed=1)
+
+                now = time.monotonic()
+                if now >= next_liveness_check:
+                    next_liveness_check = now + LIVENESS_CHECK_INTERVAL
+                    for future, child_node in list(waiting.items()):
+                        if not child_node.sup.is_responsive():
+                            failed.append(child_node.name)
+                            child_node.to_error(
+                                command = command,
+                            )
+                            del waiting[future]
+                            progress.update(apps_tasks[child_node.name], completed=1)
+
+                progress.update(total, completed = n_apps - len(waiting))
+                progress.update(timeout_bar, completed = min(now - start, timeout))
+
+            for child_node in waiting.values():
+                self.log.error(f'Timeout while waiting for a reply from \'{child_node.name}\' to \'{command}\'')
+                failed.append(child_node.name)
+                child_node.to_error(
+                    command = command,
+                    text = f'No reply to {command} after {timeout} s'
+                )
 
-                for d in done:
-                    appset.remove(d)
-                    progress.update(apps_tasks[d.name], completed=1)
-                    progress.update(total, completed = n_apps - len(appset))
+            if not waiting:
+                progress.update(timeout_bar, visible=False)
 
-                time.sleep(0.1)
+        metrics.observe('nanorc_transition_seconds', time.perf_counter() - send_start, subsystem=self.name, command=command)
 
         response= {}
         if failed:
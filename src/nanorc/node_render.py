@@ -13,7 +13,8 @@ def status_data(node, get_children=True) -> dict:
     ret = {}
     if isinstance(node, ApplicationNode):
         sup = node.sup
-        if sup.desc.proc.is_alive():
+        health = sup.health()
+        if health.alive:
             ret['process_state'] = 'alive'
         else:
             if isinstance(sup.desc.proc, K8sProcess): # hacky way to check the pm
@@ -24,7 +25,7 @@ def status_data(node, get_children=True) -> dict:
                 except sh.ErrorReturnCode as e:
                     exit_code = e.exit_code
             ret['process_state'] = f'dead[{exit_code}]'
-        ret['ping'] = sup.commander.ping()
+        ret['ping'] = health.ping
         ret['last_cmd_failed'] = (sup.last_sent_command != sup.last_ok_command)
         ret['name'] = node.name
         ret['state'] = ("error " if node.errored else "") + node.state + ("" if node.included else " - excluded")
@@ -51,8 +52,9 @@ def print_status(topnode, console, apparatus_id='', partition='') -> int:
     for pre, _, node in RenderTree(topnode):
         if isinstance(node, ApplicationNode):
             sup = node.sup
+            health = sup.health()
 
-            if sup.desc.proc.is_alive():
+            if health.alive:
                 alive = 'alive'
             else:
                 proc = sup.desc.proc
@@ -67,7 +69,7 @@ def print_status(topnode, console, apparatus_id='', partition='') -> int:
 
                 alive = f'dead[{exit_code}]'
 
-            ping = sup.commander.ping()
+            ping = health.ping
             last_cmd_failed = (sup.last_sent_command != sup.last_ok_command)
 
             state_str = ''
@@ -137,3 +139,61 @@ def print_node(node, console, leg:bool=False) -> int:
         return_code = 14
         raise RuntimeError("Tree is corrupted")
     return 0
+
+
+def print_metrics(registry, console) -> int:
+    table = Table(title="Command latencies (mean / p95, in ms)")
+    table.add_column("subsystem", style="yellow")
+    table.add_column("app", style="blue")
+    table.add_column("command", style="magenta")
+    table.add_column("count")
+    table.add_column("send→ack")
+    table.add_column("ack→reply")
+    table.add_column("total", style="bold")
+    table.add_column("max total")
+
+    def fmt(h):
+        if h is None: return ''
+        return f'{h.mean()*1000:.1f} / {h.quantile(0.95)*1000:.1f}'
+
+    for labels, total in registry.series('nanorc_command_total_seconds'):
+        ack = registry.get('nanorc_command_ack_seconds', **labels)
+        reply = registry.get('nanorc_command_reply_seconds', **labels)
+        table.add_row(
+            labels['subsystem'],
+            labels['app'],
+            labels['command'],
+            str(total.count),
+            fmt(ack),
+            fmt(reply),
+            fmt(total),
+            f'{total.max*1000:.1f}',
+        )
+
+    for labels, transition in registry.series('nanorc_transition_seconds'):
+        handling = registry.get('nanorc_reply_handling_seconds', **labels)
+        table.add_row(
+            labels['subsystem'],
+            Text('(all)', style='bright_black'),
+            labels['command'],
+            str(transition.count),
+            '',
+            Text(f'handling {fmt(handling)}' if handling else '', style='bright_black'),
+            fmt(transition),
+            f'{transition.max*1000:.1f}',
+        )
+
+    for labels, handshake in registry.series('nanorc_socks_handshake_seconds'):
+        table.add_row(
+            '',
+            Text(f'(proxy {labels["proxy"]})', style='bright_black'),
+            'connect',
+            str(handshake.count),
+            '',
+            '',
+            fmt(handshake),
+            f'{handshake.max*1000:.1f}',
+        )
+
+    console.print(table)
+    return 0
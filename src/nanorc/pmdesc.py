@@ -1,6 +1,7 @@
 import click
-from .k8spm import K8SProcessManager
-from .sshpm import SSHProcessManager
+from .k8spm import K8SProcessManager, DEFAULT_K8S_PARALLEL
+from .sshpm import SSHProcessManager, DEFAULT_SSH_PARALLEL, DEFAULT_SSH_PER_HOST, DEFAULT_TERMINATE_GRACE
+from .localpm import LocalProcessManager
 from urllib import parse
 
 
@@ -13,10 +14,11 @@ class pm_desc:
             raise click.BadParameter(f'Badly formatted --pm')
 
         self.is_ssh = (pm_uri.scheme == 'ssh')
+        self.is_local = (pm_uri.scheme == 'local')
         self.is_kind = (pm_uri.scheme == 'kind')
         self.is_k8s_cluster = (pm_uri.scheme == 'k8s')
-        if not self.is_ssh and not self.is_kind and not self.is_k8s_cluster:
-            raise click.BadParameter(f'--pm should be either ssh://, kind://, or k8s://')
+        if not self.is_ssh and not self.is_local and not self.is_kind and not self.is_k8s_cluster:
+            raise click.BadParameter(f'--pm should be either ssh://, local://, kind://, or k8s://')
 
         if self.is_kind or self.is_k8s_cluster:
             self.address = pm_uri.netloc
@@ -33,11 +35,57 @@ class pm_desc:
         if self.is_kind and self.address != "localhost":
             raise click.BadParameter(f'Kind address can only be localhost for now!')
 
+        # extra knobs, e.g. ssh://?parallel=16&per-host=4
+        try:
+            self.options = {k: v[-1] for k, v in parse.parse_qs(pm_uri.query, strict_parsing=bool(pm_uri.query)).items()}
+        except ValueError:
+            raise click.BadParameter(f'Badly formatted --pm options \'{pm_uri.query}\', they should look like ssh://?option=value&option2=value2')
+
+        if self.is_kind or self.is_k8s_cluster:
+            self.k8s_parallel = self.int_option('parallel', DEFAULT_K8S_PARALLEL)
+            self.k8s_warm_pool = self.bool_option('warm-pool', False)
+            self.k8s_prepull = self.bool_option('prepull', False)
+
+        if self.is_ssh or self.is_local:
+            self.ssh_parallel = self.int_option('parallel', DEFAULT_SSH_PARALLEL)
+            self.ssh_per_host = self.int_option('per-host', DEFAULT_SSH_PER_HOST)
+            self.ssh_multiplex = self.bool_option('multiplex', True)
+            self.ssh_launcher = self.options.get('launcher', 'app')
+            self.ssh_grace = self.int_option('grace', DEFAULT_TERMINATE_GRACE, minimum=0)
+            if self.ssh_launcher not in ['app', 'host']:
+                raise click.BadParameter(f'--pm option \'launcher\' should be \'app\' (one ssh session per application) or \'host\' (one per host), not \'{self.ssh_launcher}\'')
+
+    def int_option(self, name, default, minimum=1):
+        value = self.options.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise click.BadParameter(f'--pm option \'{name}\' should be an integer, not \'{value}\'')
+        if value < minimum:
+            raise click.BadParameter(f'--pm option \'{name}\' should be >= {minimum}')
+        return value
+
+    def bool_option(self, name, default):
+        value = self.options.get(name)
+        if value is None:
+            return default
+        if value.lower() in ['1', 'yes', 'true', 'on']:
+            return True
+        if value.lower() in ['0', 'no', 'false', 'off']:
+            return False
+        raise click.BadParameter(f'--pm option \'{name}\' should be yes or no, not \'{value}\'')
+
     def use_k8spm(self):
         return self.is_kind or self.is_k8s_cluster
 
     def use_sshpm(self):
-        return self.is_ssh
+        # the local process manager takes the same configurations as the ssh one
+        return self.is_ssh or self.is_local
+
+    def use_localpm(self):
+        return self.is_local
 
 
 class PMFactory:
@@ -65,11 +113,28 @@ class PMFactory:
                 console = self.console,
                 connections = connections,
                 log_path = event.kwargs.get('log_path'),
-                cluster_config = event.kwargs['pm']
+                cluster_config = event.kwargs['pm'],
+                parallel = pm.k8s_parallel,
+                warm_pool = pm.k8s_warm_pool,
+                prepull = pm.k8s_prepull,
+            )
+        elif pm.use_localpm():
+            return LocalProcessManager(
+                console = self.console,
+                log_path = event.kwargs.get('log_path'),
+                parallel = pm.ssh_parallel,
+                per_host = pm.ssh_per_host,
+                launcher = pm.ssh_launcher,
+                grace = pm.ssh_grace,
             )
         else:
             return SSHProcessManager(
                 console = self.console,
                 log_path = event.kwargs.get('log_path'),
                 ssh_conf = event.kwargs['ssh_conf'],
+                parallel = pm.ssh_parallel,
+                per_host = pm.ssh_per_host,
+                multiplex = pm.ssh_multiplex,
+                launcher = pm.ssh_launcher,
+                grace = pm.ssh_grace,
             )
@@ -0,0 +1,154 @@
+import os
+import logging
+import selectors
+import threading
+
+# how often (in seconds) the processes are polled when pidfds aren't available
+POLL_INTERVAL = 0.1
+
+class _Watched:
+    def __init__(self, proc, callback, stream, on_line):
+        self.proc = proc
+        self.callback = callback
+        self.stream = stream
+        self.on_line = on_line
+        self.pidfd = None
+        self.exited = False
+        self.eof = stream is None
+        self.buffer = b''
+
+    def done(self) -> bool:
+        return self.exited and self.eof
+
+
+class ProcessReactor(threading.Thread):
+    """
+    One thread tracking the exit of all the child processes (and reading their output if asked to)
+
+    Each process gets a pidfd in a selector (they are polled every POLL_INTERVAL seconds on the
+    systems without pidfd_open), its callback is called with the exit code from this thread once
+    it's reaped and its output stream is drained.
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self, name='process-reactor', daemon=True)
+        self.log = logging.getLogger(__name__)
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.watched = []
+        self.polled = []
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        os.set_blocking(self.wakeup_r, False)
+        os.set_blocking(self.wakeup_w, False)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ, None)
+
+    def watch(self, proc, callback, stream=None, on_line=None) -> None:
+        """
+        Call callback(exit_code) when the subprocess.Popen proc exits, and on_line(line) for each line it writes on stream
+        """
+        with self.lock:
+            self.watched.append(_Watched(proc, callback, stream, on_line))
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            os.write(self.wakeup_w, b'x')
+        except BlockingIOError: # already plenty to wake up for
+            pass
+
+    def _register(self, w: _Watched):
+        try:
+            w.pidfd = os.pidfd_open(w.proc.pid)
+            self.selector.register(w.pidfd, selectors.EVENT_READ, (w, 'exit'))
+        except (AttributeError, OSError): # no pidfd_open here, or the process is already gone
+            w.pidfd = None
+            self.polled.append(w)
+        if w.stream is not None:
+            os.set_blocking(w.stream.fileno(), False)
+            self.selector.register(w.stream.fileno(), selectors.EVENT_READ, (w, 'output'))
+        self._reap(w) # it may be done already
+
+    def _reap(self, w: _Watched):
+        if w.exited or w.proc.poll() is None:
+            return
+        w.exited = True
+        if w.pidfd is not None:
+            self.selector.unregister(w.pidfd)
+            os.close(w.pidfd)
+            w.pidfd = None
+        if w in self.polled:
+            self.polled.remove(w)
+        self._finish(w)
+
+    def _read(self, w: _Watched):
+        try:
+            data = os.read(w.stream.fileno(), 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+
+        if data:
+            w.buffer += data
+            *lines, w.buffer = w.buffer.split(b'\n')
+        else:
+            lines = [w.buffer] if w.buffer else []
+            w.buffer = b''
+
+        for line in lines:
+            try:
+                w.on_line(line.decode(errors='replace')+'\n')
+            except Exception as e:
+                self.log.exception(f'Output callback of process {w.proc.pid} failed: {str(e)}')
+
+        if not data:
+            w.eof = True
+            self.selector.unregister(w.stream.fileno())
+            w.stream.close()
+            self._finish(w)
+
+    def _finish(self, w: _Watched):
+        if not w.done():
+            return
+        try:
+            w.callback(w.proc.returncode)
+        except Exception as e:
+            self.log.exception(f'Exit callback of process {w.proc.pid} failed: {str(e)}')
+
+    def run(self):
+        while True:
+            with self.lock:
+                new, self.watched = self.watched, []
+            for w in new:
+                self._register(w)
+
+            for key, _ in self.selector.select(POLL_INTERVAL if self.polled else None):
+                if key.data is None:
+                    try:
+                        while os.read(self.wakeup_r, 4096): pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                w, what = key.data
+                if what == 'exit':
+                    self._reap(w)
+                else:
+                    self._read(w)
+
+            for w in list(self.polled):
+                self._reap(w)
+
+
+_reactor = None
+_reactor_lock = threading.Lock()
+
+def process_reactor() -> ProcessReactor:
+    """
+    The reactor shared by all the process managers, started the first time it's needed
+    """
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None:
+            _reactor = ProcessReactor()
+            _reactor.start()
+        return _reactor
@@ -7,6 +7,7 @@ import time
 from nanorc.auth import auth
 import threading
 from nanorc.node_render import status_data
+from nanorc.metrics import registry as metrics_registry
 from rich.console import Console
 from anytree.resolver import Resolver
 from anytree.exporter import DictExporter
@@ -92,6 +93,15 @@ class fsm(Resource):
             return resp
         return "No FSM initiated!"
 
+class metrics(Resource):
+    @auth.login_required
+    def get(self):
+        # no "I'm busy!" here, the metrics are most interesting while a command runs
+        resp = make_response(metrics_registry.to_prometheus(), 200)
+        resp.mimetype = 'text/plain'
+        resp.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+        return resp
+
 def parse_argument(form, ctx):
     commands = ctx.commands
     rc = ctx.rc
@@ -293,6 +303,7 @@ class RestApi:
         self.api.add_resource(fsm,          '/nanorcrest/fsm')
         self.api.add_resource(command,      '/nanorcrest/command')
         self.api.add_resource(run_data,     '/nanorcrest/run_data')
+        self.api.add_resource(metrics,      '/nanorcrest/metrics')
         self.app.add_url_rule('/', view_func=index)
 
     def run(self):
@@ -8,12 +8,19 @@ import atexit
 import signal
 import threading
 import queue
+import shutil
+import subprocess
+import tempfile
+import shlex
+from collections import Counter
 from datetime import datetime
 import signal
 import logging
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeRemainingColumn, TimeElapsedColumn
 from rich.table import Table
+from concurrent.futures import ThreadPoolExecutor
+from .procwatch import process_reactor
 
 
 # # ------------------------------------------------
@@ -41,6 +48,13 @@ def on_parent_exit(signum):
     return set_parent_exit_signal
 # # ------------------------------------------------
 
+# how many ssh/port checks run at the same time during boot, overall and per host
+DEFAULT_SSH_PARALLEL = 32
+DEFAULT_SSH_PER_HOST = 8
+# how long (in seconds) an idle master connection stays up when multiplexing
+SSH_CONTROL_PERSIST = 600
+DEFAULT_TERMINATE_GRACE = 30
+
 # ---
 def is_port_open(ip, port):
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -86,22 +100,200 @@ class AppProcessDescriptor(object):
         return str(vars(self))
 
 
-class AppProcessWatcherThread(threading.Thread):
-    def __init__(self, pm, app, proc):
-        threading.Thread.__init__(self)
-        self.pm = pm
-        self.app = app
-        self.proc = proc
+class AppExited(Exception):
+    def __init__(self, name, exit_code):
+        super().__init__(f'{name} exited with exit code {exit_code}')
+        self.exit_code = exit_code
+
+
+class SSHProcess(object):
+    """
+    An ssh session started with subprocess, its exit is reported by the process reactor rather than waited on
+    """
+
+    def __init__(self, popen):
+        self.popen = popen
+        self.pid = popen.pid
+        self.exit_code = None
+        self.exited = threading.Event()
 
-    def run(self):
+    def is_alive(self):
+        return not self.exited.is_set()
 
-        exc = None
+    def wait(self, timeout=None):
+        return self.exited.wait(timeout)
+
+    def set_exited(self, exit_code):
+        self.exit_code = exit_code
+        if self.popen.stdin is not None:
+            self.popen.stdin.close()
+        self.exited.set()
+
+    def signal(self, sig):
+        if not self.is_alive():
+            return
         try:
-            self.proc.wait()
-        except sh.ErrorReturnCode as e:
-            exc = e
+            self.popen.send_signal(sig)
+        except ProcessLookupError:
+            pass
+
+    def terminate(self):
+        self.signal(signal.SIGTERM)
+
+    def kill(self):
+        self.signal(signal.SIGKILL)
+
+
+class LaunchedAppProcess(object):
+    """
+    An application started by a HostLauncher, quacks like the sh process of a standalone ssh session
+    """
+
+    def __init__(self, launcher, name):
+        self.launcher = launcher
+        self.name = name
+        self.pid = None
+        self.exit_code = None
+        self.exited = threading.Event()
+
+    def is_alive(self):
+        return not self.exited.is_set() and self.launcher.is_alive()
+
+    def wait(self, timeout=None):
+        return self.exited.wait(timeout)
+
+    def set_exited(self, exit_code):
+        self.exit_code = exit_code
+        self.exited.set()
+
+    def signal(self, sig):
+        if self.pid is None or not self.is_alive():
+            return
+        # the app can be a subshell running the actual command, so its children get it too
+        self.launcher.run(f'pkill -{sig} -P {self.pid}; kill -{sig} {self.pid}')
+
+    def terminate(self):
+        self.signal('TERM')
+
+    def kill(self):
+        self.signal('KILL')
+
+
+class HostLauncher(object):
+    """
+    One ssh session launching all the applications of a host, the runtime environment script is sourced once for the apps sharing their environment
+
+    The remote script reports on its stdout when each app starts and exits (and forwards
+    the app output when the logs are kept locally), prefixed with MARKER.
+    """
+
+    MARKER = "NANORC_LAUNCHER"
+
+    def __init__(self, pm, host, descs):
+        self.pm = pm
+        self.log = logging.getLogger(f'{__name__}.launcher')
+        self.host = host
+        self.descs = {desc.name: desc for desc in descs}
+        self.ssh_args = descs[0].ssh_args
+        self.proc = None
+        self.loggers = {}
+        for desc in descs:
+            desc.proc = LaunchedAppProcess(self, desc.name)
+            if not desc.remote_log:
+                self.loggers[desc.name] = file_logger(desc.logfile)
+
+    def script(self):
+        descs = list(self.descs.values())
+        rte_scripts = {desc.rte_script for desc in descs}
+        if len(rte_scripts) != 1:
+            raise RuntimeError(f'The apps on {self.host} use different runtime environment scripts ({rte_scripts}), they can\'t share a launcher')
+
+        # the env is exported before the RTE script is sourced, like for a standalone app, so
+        # the RTE script is sourced once for what is common to all the apps, and again in the
+        # subshell of each app that has more: these are started before the shared source
+        common = dict(descs[0].env)
+        for desc in descs[1:]:
+            common = {k: v for k, v in common.items() if desc.env.get(k) == v}
+        rte_script = rte_scripts.pop()
+
+        lines = [f'export {n}=\"{v}\"' for n, v in common.items()]
+        shared = []
+        for desc in descs:
+            exports = ''.join(f'export {n}=\"{v}\";' for n, v in desc.env.items() if n not in common)
+            if exports:
+                lines += [self.launch_line(desc, f'{exports}source {rte_script};{desc.run_cmd}')]
+            else:
+                shared.append(desc)
+
+        if shared:
+            lines += [f'source {rte_script}']
+            lines += [self.launch_line(desc, desc.run_cmd) for desc in shared]
+        lines += ['wait']
+        return '\n'.join(lines)
+
+    def launch_line(self, desc, cmd):
+        if desc.remote_log:
+            redirect = f'&> {desc.remote_log}'
+        else:
+            redirect = f'> >(while IFS= read -r l; do printf "%s\\n" "{self.MARKER} LOG {desc.name} $l"; done) 2>&1'
+        return (
+            f'{{ ( {cmd} ) {redirect} & pid=$!; '
+            f'echo "{self.MARKER} STARTED {desc.name} $pid"; '
+            f'wait $pid; echo "{self.MARKER} EXITED {desc.name} $?"; }} &'
+        )
+
+    def start(self, preexec_fn=None):
+        self.proc = self.pm.spawn(
+            self.host,
+            *self.ssh_args,
+            f'bash -c {shlex.quote(self.script())}',
+            stdout = subprocess.PIPE,
+            preexec_fn = preexec_fn,
+        )
+        process_reactor().watch(self.proc.popen, self.on_done, stream=self.proc.popen.stdout, on_line=self.on_output)
+
+    def is_alive(self):
+        return self.proc is not None and self.proc.is_alive()
+
+    def run(self, cmd):
+        """
+        Run a command on the host, outside of the launcher session
+        """
+        self.pm.ssh(self.host, *[a for a in self.ssh_args if a != '-tt'], cmd)
+
+    def on_output(self, line, stdin=None):
+        if type(line) != str:
+            return
+        line = line.rstrip('\r\n')
+        if not line.startswith(self.MARKER+' '):
+            self.log.debug(f'{self.host}: {line}')
+            return
+
+        _, what, rest = line.split(' ', 2)
+        name, _, value = rest.partition(' ')
+        desc = self.descs.get(name)
+        if desc is None:
+            self.log.debug(f'{self.host}: {line}')
+            return
 
-        self.pm.notify_join(self.app, self, exc)
+        if what == 'LOG':
+            logger = self.loggers.get(name)
+            if logger:
+                logger(value+'\n', None)
+        elif what == 'STARTED':
+            desc.proc.pid = int(value)
+        elif what == 'EXITED':
+            exit_code = int(value)
+            desc.proc.set_exited(exit_code)
+            self.pm.notify_join(name, self, AppExited(name, exit_code) if exit_code else None)
+
+    def on_done(self, exit_code):
+        self.proc.set_exited(exit_code)
+        # if the session went away, so did the apps
+        for desc in self.descs.values():
+            if not desc.proc.exited.is_set():
+                desc.proc.set_exited(None)
+                self.pm.notify_join(desc.name, self, AppExited(desc.name, exit_code))
 
 
 # ---
@@ -116,16 +308,30 @@ class SSHProcessManager(object):
         for i in instances:
             i.kill()
 
-    def __init__(self, console: Console, log_path, ssh_conf):
+    def __init__(self, console: Console, log_path, ssh_conf, parallel=DEFAULT_SSH_PARALLEL, per_host=DEFAULT_SSH_PER_HOST, multiplex=True, launcher='app', grace=DEFAULT_TERMINATE_GRACE):
         super(SSHProcessManager, self).__init__()
         self.console = console
         self.log = logging.getLogger(__name__)
         self.apps = {}
         self.services = {}
-        self.watchers = []
         self.event_queue = queue.Queue()
+        self.exit_listeners = []
         self.ssh_conf = ssh_conf
         self.log_path = log_path
+        self.parallel = parallel
+        self.per_host = per_host
+        # one master connection per host that all the ssh commands go through
+        self.multiplex = multiplex
+        self.control_dir = None
+        self.masters = set()
+        self.connection_setups = Counter()
+        self.connection_lock = threading.Lock()
+        # 'app': one ssh session per app, 'host': one session per host launching all its apps
+        self.launcher = launcher
+        self.launchers = {}
+        # how long (in seconds) the processes get to stop after SIGTERM before they are killed
+        self.grace = grace
+        self.shutdown_times = {}
         # Add self to the list of instances
         self.__instances.add(self)
 
@@ -135,15 +341,108 @@ class SSHProcessManager(object):
         self.kill()
 
     def watch(self, name, proc):
-        t = AppProcessWatcherThread(self, name, proc)
-        t.start()
+        def on_exit(exit_code):
+            proc.set_exited(exit_code)
+            self.notify_join(name, proc, AppExited(name, exit_code) if exit_code else None)
+        process_reactor().watch(proc.popen, on_exit)
 
-        self.watchers.append(t)
+    def add_exit_listener(self, callback):
+        """
+        callback(name, exit_code) gets called (from the process reactor thread) when an application exits
+        """
+        self.exit_listeners.append(callback)
 
     def notify_join(self, name, watcher, exc):
         self.log.info(f"{name} process exited"+(f" with exit code {exc.exit_code}" if exc else ""))
         self.log.debug(name+str(exc))
         self.event_queue.put((name, exc))
+        for callback in list(self.exit_listeners):
+            try:
+                callback(name, exc.exit_code if exc else 0)
+            except Exception as e:
+                self.log.error(f'Exit listener failed for {name}: {str(e)}')
+
+    def mux_args(self):
+        """
+        The ssh options to go through the master connection of the host (if there is one, ssh connects directly otherwise)
+        """
+        if not self.multiplex:
+            return []
+        if self.control_dir is None:
+            self.control_dir = tempfile.mkdtemp(prefix='nanorc-ssh-')
+        return [f"-o ControlPath={self.control_dir}/%C", "-o ControlMaster=no"]
+
+    def count_connection(self, host):
+        with self.connection_lock:
+            self.connection_setups[host] += 1
+
+    def ssh(self, host, *args, **kwargs):
+        """
+        sh.ssh, counting a new connection for host if it doesn't go through a master connection
+        """
+        if not self.multiplex or host not in self.masters:
+            self.count_connection(host)
+        return sh.ssh(*args, **kwargs)
+
+    def spawn(self, host, *args, stdout=subprocess.DEVNULL, preexec_fn=None):
+        """
+        Start ssh in the background in a new session, stderr goes with stdout
+
+        stdin is a pipe kept open (and never written to) until ssh exits: with -tt, the
+        remote pty would get EOF straight away from /dev/null and hang up the app.
+        """
+        if not self.multiplex or host not in self.masters:
+            self.count_connection(host)
+        popen = subprocess.Popen(
+            ["ssh"] + list(args),
+            stdin = subprocess.PIPE,
+            stdout = stdout,
+            stderr = subprocess.STDOUT,
+            start_new_session = True,
+            preexec_fn = preexec_fn,
+        )
+        return SSHProcess(popen)
+
+    def open_master(self, host):
+        self.mux_args() # makes sure the control directory exists
+        master_args = [
+            "ssh", "-M", "-N", "-f",
+            "-o StrictHostKeyChecking=no",
+            f"-o ControlPath={self.control_dir}/%C",
+            f"-o ControlPersist={SSH_CONTROL_PERSIST}",
+        ] + self.ssh_conf + [host]
+
+        # the master goes in the background and keeps its stderr, so not a pipe we would wait on forever
+        with tempfile.TemporaryFile() as err:
+            try:
+                ret = subprocess.run(master_args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=err, timeout=60)
+            except subprocess.TimeoutExpired:
+                raise RuntimeError(f'Timeout while opening a master connection to {host}')
+            if ret.returncode != 0:
+                err.seek(0)
+                raise RuntimeError(f'Couldn\'t open a master connection to {host}: {err.read().decode(errors="replace").strip()}')
+
+        self.count_connection(host)
+        with self.connection_lock:
+            self.masters.add(host)
+
+    def close_masters(self):
+        for host in list(self.masters):
+            try:
+                subprocess.run(
+                    ["ssh", f"-o ControlPath={self.control_dir}/%C", "-O", "exit", host],
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10
+                )
+            except Exception as e:
+                self.log.error(f'Couldn\'t close the master connection to {host}: {str(e)}')
+        self.masters = set()
+
+        if self.control_dir:
+            shutil.rmtree(self.control_dir, ignore_errors=True)
+        self.control_dir = None
+
+        if self.connection_setups:
+            self.log.info('ssh connections set up per host: '+', '.join(f'{host}: {n}' for host, n in sorted(self.connection_setups.items())))
 
     def execute_script(self, script_data):
         env_vars = script_data["env"]
@@ -152,8 +451,8 @@ class SSHProcessManager(object):
         hosts = set(self.boot_info["hosts-ctrl"].values())
         for host in hosts:
             self.log.info(f'Executing {script_data["cmd"]} on {host}.')
-            ssh_args = [host, "-tt", "-o StrictHostKeyChecking=no"] + [cmd]
-            proc = sh.ssh(ssh_args)
+            ssh_args = [host, "-tt", "-o StrictHostKeyChecking=no"] + self.mux_args() + [cmd]
+            proc = self.ssh(host, ssh_args)
             self.log.info(proc)
 
     def setup_app(self, app_name, app_conf, conf_loc):
@@ -177,9 +476,6 @@ class SSHProcessManager(object):
             "APP_WD": os.getcwd(),
             "CONF_LOC": conf_loc,
         }
-        if is_port_open(host, app_conf["port"]):
-            raise RuntimeError(f'The port {host}:{app_conf["port"]} is already open, likely by another application, cannot continue')
-
         if 'update-env' in app_conf:
             for k,v in app_conf['update-env'].items():
                 self.boot_info["env"][k]=v.format(**env_formatter) if type(v) is str else v
@@ -206,43 +502,118 @@ class SSHProcessManager(object):
             [f"cd {env_formatter['APP_WD']}"] +
             [self.boot_info['exec'][app_conf['exec']]['cmd']+" "+args]
         )
+        run_cmd = cmd
 
         cmd = ';'.join(env_var)+f';source {rte_script};{cmd}'
 
+        remote_log = None
         if self.log_path:
             now = datetime.now() # current date and time
             date_time = now.strftime("%Y-%m-%d_%H%M%S")
             log_file_localhost = f'log_{date_time}_{app_name}_{app_conf["port"]}.txt'
-            cmd = "{ "+cmd+"; } &> "+ self.log_path+"/"+log_file_localhost
+            remote_log = self.log_path+"/"+log_file_localhost
+            cmd = "{ "+cmd+"; } &> "+ remote_log
             self.console.print(f'\'{app_name}\' logs are in \'{host}:{self.log_path}/{log_file_localhost}\'')
         else:
             import socket
             self.console.print(f'\'{app_name}\' logs are in \'{socket.gethostname()}:{os.getcwd()}/{log_file}\'')
 
-        ssh_args = [host, "-tt", "-o StrictHostKeyChecking=no"]
+        ssh_args = [host, "-tt", "-o StrictHostKeyChecking=no"] + self.mux_args()
         # if not self.can_use_kerb:
         ssh_args += self.ssh_conf
 
-        ssh_test_args = ssh_args+['echo "Knock knock, tricks or treats!"']
-
-        try:
-            test_proc = sh.ssh(ssh_test_args)
-        except Exception as e:
-            self.log.error(f'I cannot ssh to {host}:')
-            self.log.error(f'ssh {" ".join(ssh_test_args)}')
-            raise e
-
-        #ssh_args += [cmd]
-
         desc = AppProcessDescriptor(app_name)
         desc.logfile = log_file
         desc.cmd = cmd
+        # the pieces of cmd, for the per host launcher
+        desc.env = app_vars
+        desc.run_cmd = run_cmd
+        desc.rte_script = rte_script
+        desc.remote_log = remote_log
         desc.ssh_args = ssh_args
         desc.host = host
         desc.port = app_conf["port"]
         desc.conf = app_conf.copy()
         return desc
 
+    def run_concurrently(self, tasks):
+        """
+        Run the (host, function, args) tasks, at most self.parallel at once and self.per_host on the same host
+
+        Returns:
+            list: (result, exception) of each task, in the order of tasks
+        """
+        if not tasks:
+            return []
+        semaphores = {host: threading.BoundedSemaphore(self.per_host) for host, _, _ in tasks}
+
+        def run(host, function, args):
+            with semaphores[host]:
+                return function(*args)
+
+        results = []
+        with ThreadPoolExecutor(max_workers=max(1, min(self.parallel, len(tasks))), thread_name_prefix='sshpm') as pool:
+            futures = [pool.submit(run, *task) for task in tasks]
+            for future in futures:
+                try:
+                    results.append((future.result(), None))
+                except Exception as e:
+                    results.append((None, e))
+        return results
+
+    def knock(self, host, ssh_args):
+        ssh_test_args = ssh_args+['echo "Knock knock, tricks or treats!"']
+        if self.multiplex:
+            try:
+                self.open_master(host)
+            except Exception as e:
+                # only an optimisation: ssh connects directly without a master
+                self.log.warning(f'{str(e).strip()}, {host} will not use multiplexing')
+        try:
+            self.ssh(host, ssh_test_args)
+        except Exception as e:
+            self.log.error(f'I cannot ssh to {host}:')
+            self.log.error(f'ssh {" ".join(ssh_test_args)}')
+            raise e
+
+    def check_hosts(self, descs):
+        """
+        Check, concurrently, that we can ssh to every host once and that none of the ports are already taken
+
+        Raises:
+            RuntimeError: listing all the hosts that failed
+        """
+        hosts = {}
+        for desc in descs:
+            hosts.setdefault(desc.host, desc.ssh_args)
+
+        start = time.perf_counter()
+        knocks = self.run_concurrently([(host, self.knock, (host, ssh_args)) for host, ssh_args in hosts.items()])
+        ports = self.run_concurrently([(desc.host, is_port_open, (desc.host, desc.port)) for desc in descs])
+        self.log.info(f'Checked {len(hosts)} hosts and {len(descs)} ports in {time.perf_counter()-start:.2f} s'+(f' ({len(self.masters)} master connections open)' if self.multiplex else ''))
+
+        unreachable = {host: e for host, (_, e) in zip(hosts, knocks) if e is not None}
+        taken = [f"{desc.name} ({desc.host}:{desc.port})" for desc, (is_open, _) in zip(descs, ports) if is_open]
+
+        errors = []
+        if unreachable:
+            errors.append(f'cannot ssh to {len(unreachable)} host(s): '+', '.join(f'{host} ({str(e).strip()})' for host, e in unreachable.items()))
+        if taken:
+            errors.append(f'ports already open, apps already running? {taken}')
+        if errors:
+            raise RuntimeError("ERROR: "+'\n'.join(errors))
+
+    def launch(self, desc, preexec_fn=None):
+        ssh_args=desc.ssh_args + [desc.cmd]
+        # the output goes straight to the log file, no thread is needed to copy it
+        if not self.log_path:
+            with open(desc.logfile, "w") as log:
+                proc = self.spawn(desc.host, *ssh_args, stdout=log, preexec_fn=preexec_fn)
+        else:
+            proc = self.spawn(desc.host, *ssh_args, preexec_fn=preexec_fn)
+        self.watch(desc.name, proc)
+        desc.proc = proc
+
     def boot(self, boot_info, conf_loc, timeout):
 
         if self.apps:
@@ -255,47 +626,37 @@ class SSHProcessManager(object):
         apps = boot_info["apps"]
 
 
+        # The environment of an app can depend on the ones before it (update-env), so that part is done in order
         self.console.print(f'Looking for services')
         services = boot_info.get("services")
-        if services:
-            for srv_name, srv_conf in services.items():
-                desc=self.setup_app(srv_name, srv_conf, conf_loc)
-                self.services[srv_name] = desc
-                ssh_args=desc.ssh_args + [desc.cmd]
-                proc = sh.ssh(
-                    *ssh_args,
-                    _out=file_logger(desc.logfile) if not self.log_path else None,
-                    _bg=True,
-                    _bg_exc=False,
-                    _new_session=True,
-                    #_preexec_fn=on_parent_exit(signal.SIGTERM), # should be here too
-                )
-                self.watch(srv_name, proc)
-                desc.proc = proc
-
-        for app_name, app_conf in apps.items():
-            desc=self.setup_app(app_name, app_conf, conf_loc)
-            self.apps[app_name] = desc
-
-        apps_running = []
-        for name, desc in self.apps.items():
-            if is_port_open(desc.host, desc.port):
-                apps_running += [f"{name} ({desc.host}:{desc.port})"]
-        if apps_running:
-            raise RuntimeError(f"ERROR: apps already running? {apps_running}")
-
-        for name, desc in self.apps.items():
-            ssh_args=desc.ssh_args + [desc.cmd]
-            proc = sh.ssh(
-                *ssh_args,
-                _out = file_logger(desc.logfile) if not self.log_path else None,
-                _bg = True,
-                _bg_exc = False,
-                _new_session = True,
-                _preexec_fn = on_parent_exit(signal.SIGTERM)
-            )
-            self.watch(name, proc)
-            desc.proc = proc
+        service_descs = [self.setup_app(srv_name, srv_conf, conf_loc) for srv_name, srv_conf in services.items()] if services else []
+        app_descs = [self.setup_app(app_name, app_conf, conf_loc) for app_name, app_conf in apps.items()]
+
+        # the ssh handshakes and port checks are what takes time
+        self.check_hosts(service_descs+app_descs)
+
+        # The processes are started from this thread: PR_SET_PDEATHSIG fires when the thread
+        # that forked them exits, so they can't be forked from a short lived worker thread.
+        # Forking is quick, the ssh connections are then established concurrently anyway.
+        for desc in service_descs:
+            self.services[desc.name] = desc
+            self.launch(desc)
+            #_preexec_fn=on_parent_exit(signal.SIGTERM), # should be here too
+
+        if self.launcher == 'host':
+            hosts = {}
+            for desc in app_descs:
+                self.apps[desc.name] = desc
+                hosts.setdefault(desc.host, []).append(desc)
+            for host, descs in hosts.items():
+                launcher = HostLauncher(self, host, descs)
+                self.launchers[host] = launcher
+                launcher.start(on_parent_exit(signal.SIGTERM))
+            self.log.info(f'Launched {len(app_descs)} apps through {len(hosts)} host sessions')
+        else:
+            for desc in app_descs:
+                self.apps[desc.name] = desc
+                self.launch(desc, on_parent_exit(signal.SIGTERM))
 
         with Progress(
             SpinnerColumn(),
@@ -341,19 +702,13 @@ class SSHProcessManager(object):
 
             # Process status
             if not desc.proc.is_alive():
-                try:
-                    exit_code = desc.proc.exit_code
-                except sh.ErrorReturnCode as e:
-                    exit_code = e.exit_code
-                failed[name] = exit_code
+                failed[name] = desc.proc.exit_code
             else:
                 alive += [name]
 
-                # Command port status
-                if is_port_open(
-                        desc.host, desc.conf["port"]
-                    ):
-                    responding += [name]
+        # Command port status
+        ports = self.run_concurrently([(self.apps[name].host, is_port_open, (self.apps[name].host, self.apps[name].conf["port"])) for name in alive])
+        responding = [name for name, (is_open, _) in zip(alive, ports) if is_open]
 
         return alive, failed, responding
 
@@ -371,59 +726,112 @@ class SSHProcessManager(object):
         self.console.print(table)
 
 
-    def terminate(self):
-        for name, desc in self.apps.items():
-            if desc.proc is not None and desc.proc.is_alive():
+    def stop_launchers(self):
+        # the host sessions end by themselves once their apps are gone, this is for the ones that don't
+        for host, launcher in self.launchers.items():
+            if launcher.is_alive():
                 try:
-                    desc.proc.terminate()
-                    while desc.proc.is_alive():
-                        time.sleep(0.1)
+                    launcher.proc.terminate()
                 except OSError:
                     pass
+        self.launchers = {}
+
+    def signal_all(self, descs, kill=False):
+        """
+        Send SIGTERM (SIGKILL if kill) to all the processes at once, returns the descs of the ones that got it
+        """
+        alive = [desc for desc in descs if desc.proc is not None and desc.proc.is_alive()]
+        results = self.run_concurrently([(desc.host, desc.proc.kill if kill else desc.proc.terminate, ()) for desc in alive])
+        signalled = []
+        for desc, (_, e) in zip(alive, results):
+            if e is None:
+                signalled.append(desc)
+            elif not isinstance(e, OSError):
+                self.log.error(f'Couldn\'t {"kill" if kill else "terminate"} {desc.name}: {str(e)}')
+        return signalled
+
+    def stop_processes(self, descs, grace):
+        """
+        Terminate all the processes together, wait for them until a shared deadline and SIGKILL the ones still alive after it
+
+        Returns:
+            dict: name -> time it took to stop (None for the processes that had to be killed)
+        """
+        start = time.monotonic()
+        deadline = start + grace
+        pending = {desc.name: desc for desc in self.signal_all(descs)}
+        shutdown_times = {}
+
+        def collect():
+            for name, desc in list(pending.items()):
+                if not desc.proc.is_alive():
+                    shutdown_times[name] = time.monotonic() - start
+                    del pending[name]
+
+        collect()
+        while pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+            collect()
+
+        if pending:
+            self.log.warning(f'{list(pending.keys())} still alive {grace} s after being terminated, killing them')
+            for desc in self.signal_all(pending.values(), kill=True):
+                shutdown_times[desc.name] = None
+            kill_deadline = time.monotonic() + 5
+            while any(desc.proc.is_alive() for desc in pending.values()) and time.monotonic() < kill_deadline:
+                time.sleep(0.05)
+
+        for name, t in sorted(shutdown_times.items(), key=lambda i: -1 if i[1] is None else i[1], reverse=True):
+            self.log.debug(f'{name} '+('killed' if t is None else f'stopped in {t:.2f} s'))
+        if shutdown_times:
+            stopped = {n: t for n, t in shutdown_times.items() if t is not None}
+            slowest = max(stopped, key=stopped.get) if stopped else None
+            killed = [n for n, t in shutdown_times.items() if t is None]
+            self.log.info(
+                f'Stopped {len(shutdown_times)} processes in {time.monotonic()-start:.2f} s'
+                + (f', slowest: {slowest} ({stopped[slowest]:.2f} s)' if slowest else '')
+                + (f', killed: {killed}' if killed else '')
+            )
+        self.shutdown_times.update(shutdown_times)
+        return shutdown_times
+
+    def terminate(self):
+        self.shutdown_times = {}
+        self.stop_processes(self.apps.values(), self.grace)
         self.apps = {}
+        self.stop_launchers()
+        self.stop_processes(self.services.values(), self.grace)
         for name, desc in self.services.items():
-            if desc.proc is not None and desc.proc.is_alive():
-                try:
-                    desc.proc.terminate()
-                    while desc.proc.is_alive():
-                        time.sleep(0.1)
-                except OSError:
-                    pass
             pid_file = f"{name}_{desc.port}.pid"
             if os.path.exists(pid_file):
                 with open(pid_file, "r") as pf:
                     pid=pf.read().replace('\n', '')
                 ssh_args=desc.ssh_args + [f"kill {pid}"]
                 try:
-                    sh.ssh(*ssh_args)
+                    self.ssh(desc.host, *ssh_args)
                 except Exception as e:
                     self.log.error(f'Couldn\'t kill the connectivity service on pid {pid}, it may already be dead?')
 
         self.services = {}
+        self.close_masters()
+
     def kill(self):
-        for name, desc in self.apps.items():
-            if desc.proc is not None and desc.proc.is_alive():
-                try:
-                    desc.proc.kill()
-                except OSError:
-                    pass
+        self.signal_all(self.apps.values(), kill=True)
         self.apps = {}
+        self.stop_launchers()
+        self.signal_all(self.services.values(), kill=True)
         for name, desc in self.services.items():
-            if desc.proc is not None and desc.proc.is_alive():
-                try:
-                    desc.proc.kill()
-                except OSError:
-                    pass
             pid_file = f"{name}_{desc.port}.pid"
             if os.path.exists(pid_file):
                 with open(pid_file, "r") as pf:
                     pid=pf.read().replace('\n', '')
                 ssh_args=desc.ssh_args + [f"kill -9 {pid}"]
                 try:
-                    sh.ssh(*ssh_args)
+                    self.ssh(desc.host, *ssh_args)
                 except Exception as e:
                     self.log.error(f'Couldn\'t kill the connectivity service on pid {pid}, it may already be dead?')
         self.services = {}
+        self.close_masters()
 
 # Cleanup before exiting
 def __goodbye(*args, **kwargs):
@@ -4,9 +4,10 @@ import logging
 from enum import IntEnum
 import threading
 from queue import Queue
-from transitions.core import MachineError
 import time
-from .fsm import FSM
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .fsm import get_fsm, EventData
 
 class ErrorCode(IntEnum):
     Success=0
@@ -42,15 +43,57 @@ class StatefulNode(NodeMixin):
             self.children = children
 
         self.fsm_conf = fsm_conf
-        self.fsm = FSM(self.console, fsm_conf, verbose)
-        self.fsm.make_node_fsm(self)
+        self.fsm = get_fsm(self.console, fsm_conf, verbose)
+        self.state = self.fsm.initial
         self.return_code = ErrorCode.Success
         self.status_receiver_queue = Queue()
+        self.received_responses = {}
+        self.response_lock = threading.Lock()
         self.order = order if order else dict()
         self.included = True
         self.errored = False
 
 
+    def __getattr__(self, name):
+        # the FSM triggers: boot(), end_boot(), to_initial(), can_boot()...
+        fsm = self.__dict__.get('fsm')
+        if fsm is not None:
+            if name.startswith('can_') and name[4:] in fsm.triggers:
+                return partial(self._can, name[4:])
+            if fsm.is_trigger(name):
+                return partial(self.trigger, name)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def _can(self, trigger):
+        return self.fsm.can(self.state, trigger)
+
+    def get_destination(self, transition):
+        return self.fsm.get_destination(transition)
+
+    def trigger(self, trigger, **kwargs):
+        """
+        Go through the FSM transition trigger, calling the on_exit_<source> and on_enter_<dest> callbacks
+
+        Raises:
+            FSMError: if trigger isn't possible from the current state
+        """
+        source = self.state
+        dest = self.fsm.next_state(source, trigger)
+        event = EventData(self, trigger, source, dest, kwargs)
+
+        callback = self._state_callback('exit', source)
+        if callback: callback(event)
+        self.state = dest
+        callback = self._state_callback('enter', dest)
+        if callback: callback(event)
+        return True
+
+    def _state_callback(self, kind, state):
+        callback = getattr(self, f'on_{kind}_{state}', None)
+        if callback is None and state in self.fsm.transient_states:
+            callback = self._on_enter_callback if kind == 'enter' else self._on_exit_callback
+        return callback
+
     def can_execute_custom_or_expert(self, command, quiet=True, check_dead=True, check_inerror=True, only_included=True, check_children=True):
         disallowed_state = ['booted', 'none']
         if self.errored and check_inerror:
@@ -225,44 +268,141 @@ class StatefulNode(NodeMixin):
         self.log.error(etext)
         self.errored = True
 
+    def command_graph(self, command) -> dict:
+        """
+        Which children have to be done before each child gets command: {child name: set of child names}
+
+        The command_order entry of a command can be
+         - a list of names: the children get the command one after the other,
+         - a list of stages, each a name or a list of names: the children of a stage get the command
+           together, once all the children of the previous stage are done,
+         - a dict {name: [names it depends on]}.
+        Only the children listed get the command. Without an entry, the children get it one after
+        the other, in the order they are declared.
+        """
+        order = self.order.get(command)
+        if order is None:
+            order = [c.name for c in self.children]
+
+        graph = {}
+        if isinstance(order, dict):
+            for name, deps in order.items():
+                deps = [deps] if isinstance(deps, str) else list(deps or [])
+                graph[name] = set(deps)
+            for deps in list(graph.values()):
+                for dep in deps:
+                    graph.setdefault(dep, set())
+        else:
+            previous = set()
+            for stage in order:
+                stage = [stage] if isinstance(stage, str) else list(stage)
+                for name in stage:
+                    graph[name] = set(previous)
+                previous = set(stage)
+
+        children = [c.name for c in self.children]
+        unknown = [n for n in graph if n not in children]
+        if unknown:
+            raise RuntimeError(f'The order of \'{command}\' on \'{self.name}\' refers to {unknown}, which aren\'t children of it ({children})')
+
+        self._command_stages(command, graph) # raises if there is a cycle
+        return graph
+
+    def _command_stages(self, command, graph) -> list:
+        stages = []
+        done = set()
+        remaining = dict(graph)
+        while remaining:
+            stage = [n for n, deps in remaining.items() if deps <= done]
+            if not stage:
+                raise RuntimeError(f'The order of \'{command}\' on \'{self.name}\' has a dependency cycle between {list(remaining.keys())}')
+            for n in stage:
+                del remaining[n]
+            done.update(stage)
+            stages.append(stage)
+        return stages
+
+    def _pop_response(self, name):
+        # the responses of the children arrive in any order when they run concurrently
+        with self.response_lock:
+            while not self.status_receiver_queue.empty():
+                response = self.status_receiver_queue.get_nowait()
+                if response:
+                    self.received_responses[response["node"]] = response
+            return self.received_responses.pop(name, None)
+
+    def _propagate_to(self, child, command, kwargs) -> NoReturn:
+        self.log.debug(f'Sending {command} to {child.name}')
+        with self.response_lock:
+            self.received_responses.pop(child.name, None)
+        child.trigger(command, **kwargs)
+        # the child is done once trigger returns, so its response is already there if it sent one
+        response = self._pop_response(child.name)
+        if not response:
+            raise RuntimeError(f"{child.name} didn't report back after {command}")
+        if response["status_code"] != ErrorCode.Success:
+            raise RuntimeError(f"Failed to {command} {child.name}, error {str(response)}")
+
     def _on_enter_callback(self, event):
         command = event.event.name
         self.log.debug(f"'{self.name}' received command '{command}'")
         source_state = event.transition.source
         force = event.kwargs.get('force')
 
-        if command in self.order:
-            self.log.debug(f'Propagating to the included children nodes in the order {self.order[command]}')
-        else:
-            self.order[command] = [c.name for c in self.children]
-            self.log.debug(f'Propagating to children nodes in the order: {self.order[command]}')
+        graph = self.command_graph(command)
+        stages = self._command_stages(command, graph)
+        parallel = any(len(stage) > 1 for stage in stages)
+        self.log.debug(f'Propagating to the included children nodes in the stages {stages}')
+
+        kwargs = dict(event.kwargs)
+        if parallel:
+            # rich can only show one progress display at a time
+            kwargs['progress'] = False
 
         status = ErrorCode.Success
         failed = []
+        children = {c.name: c for c in self.children}
+
+        def handle_failure(name, e):
+            nonlocal status
+            failed.append(name)
+            if force:
+                self.log.error(f'Failed to send \'{command}\' to \'{name}\', --force was specified so continuing anyway, {str(e)}')
+            else:
+                self.log.error(f'Failed to send \'{command}\' to \'{name}\': {str(e)}')
+                status = ErrorCode.Failed
 
-        for cn in self.order[command]:
-            child = [c for c in self.children if c.name == cn][0]
-            if not child.included: continue
-            self.log.debug(f'Sending {command} to {child.name}')
-            try:
-                child.trigger(command, **event.kwargs)
-                for _ in range(event.kwargs["timeout"]):
-                    response = self.status_receiver_queue.get()
-                    if response:
-                        if response["node"] == child.name:
-                            if response["status_code"] != ErrorCode.Success:
-                                failed+=[child.name]
-                                raise RuntimeError(f"Failed to {command} {child.name}, error {str(response)}")
-                            else:
-                                break
-
-                    time.sleep(1)
-
-            except Exception as e:
-                if force:
-                    self.log.error(f'Failed to send \'{command}\' to \'{child.name}\', --force was specified so continuing anyway, {str(e)}')
+        # a child can go as soon as all the ones it depends on are done, whether they succeeded or not
+        done = set()
+        remaining = dict(graph)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(len(stage) for stage in stages) if stages else 1, thread_name_prefix=f'{self.name}-{command}') as pool:
+            while remaining or running:
+                for name in [n for n, deps in remaining.items() if deps <= done]:
+                    del remaining[name]
+                    if not children[name].included:
+                        done.add(name)
+                        continue
+                    if parallel:
+                        running[pool.submit(self._propagate_to, children[name], command, kwargs)] = name
+                    else:
+                        try:
+                            self._propagate_to(children[name], command, kwargs)
+                        except Exception as e:
+                            handle_failure(name, e)
+                        done.add(name)
+
+                if not running:
                     continue
-                status = ErrorCode.Failed
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        handle_failure(name, e)
+                    done.add(name)
 
         response = {
             "status_code" : status,
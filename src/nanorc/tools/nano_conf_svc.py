@@ -41,6 +41,8 @@ def svc(json_dir, name, port):
         cs.terminate()
 
     signal.signal(signal.SIGINT, signal_handler)
+    # the server runs in a thread of this process now, serve until interrupted
+    cs.server_thread.join()
 
 def main():
     try:
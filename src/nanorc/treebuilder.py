@@ -4,12 +4,18 @@ from .cfgmgr import ConfigManager
 import os
 import copy as cp
 import json
+import time
 from pathlib import Path
 from urllib.parse import ParseResult
 from collections import OrderedDict
 from json import JSONDecoder
 from pathlib import Path
+from typing import NoReturn
 from anytree import PreOrderIter
+from concurrent.futures import ThreadPoolExecutor
+
+# how many subsystem configurations are loaded at once
+MAX_CONFIG_LOADERS = 16
 
 def dict_raise_on_duplicates(ordered_pairs):
     count=0
@@ -30,7 +36,14 @@ class ConfigManagerCreationFailed(Exception):
 
 
 class TreeBuilder:
-    def extract_json_to_nodes(self, js, mother, fsm_conf) -> StatefulNode:
+    def collect_subsystems(self, js, mother, fsm_conf, subsystems, layout) -> NoReturn:
+        """
+        Create the intermediate nodes and list the subsystems in the order of the configuration
+
+        The port offset of each subsystem is decided here, so it doesn't depend on which configuration loads first.
+        The layout refers to the subsystems by their index in subsystems: their names are only unique under a node.
+        """
+        layout[mother] = []
         for n,d in js.items():
             if isinstance(d, dict):
                 child = StatefulNode(
@@ -39,35 +52,61 @@ class TreeBuilder:
                     console=self.console,
                     fsm_conf = fsm_conf
                 )
+                layout[mother].append(child)
 
-                self.extract_json_to_nodes(d, child, fsm_conf = fsm_conf)
+                self.collect_subsystems(d, child, fsm_conf, subsystems, layout)
 
             elif isinstance(d, ParseResult):
-                try:
-                    cfgmgr = ConfigManager(
-                        log = self.log,
-                        process_manager_description = self.process_manager_description,
-                        config_url = d,
-                        session = self.session,
-                        port_offset = self.port_offset+self.subsystem_port_offset,
-                        upload_to = self.conf_server
-                    )
-                except Exception as e:
-                    raise ConfigManagerCreationFailed(n) from e
-
-                node = SubsystemNode(
-                    name = n,
-                    log = self.log,
-                    cfgmgr = cfgmgr,
-                    console=self.console,
-                    fsm_conf = fsm_conf,
-                    parent = mother
-                )
+                layout[mother].append(len(subsystems))
+                subsystems.append((n, d, mother, self.port_offset+self.subsystem_port_offset))
                 self.subsystem_port_offset += self.subsystem_port_increment
             else:
                 self.log.error(f"ERROR processing the tree {n}: {d} I don't know what that's supposed to mean?")
                 exit(1)
 
+    def load_config(self, config_url, port_offset) -> ConfigManager:
+        return ConfigManager(
+            log = self.log,
+            process_manager_description = self.process_manager_description,
+            config_url = config_url,
+            session = self.session,
+            port_offset = port_offset,
+            upload_to = self.conf_server
+        )
+
+    def extract_json_to_nodes(self, js, mother, fsm_conf) -> StatefulNode:
+        subsystems = []
+        layout = {}
+        self.collect_subsystems(js, mother, fsm_conf, subsystems, layout)
+
+        # fetching, preparing and uploading the configurations is independent from one subsystem to the other
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_CONFIG_LOADERS, len(subsystems))), thread_name_prefix='cfgmgr') as pool:
+            futures = [pool.submit(self.load_config, d, port_offset) for n, d, _, port_offset in subsystems]
+
+        nodes = {}
+        for i, ((n, d, parent, _), future) in enumerate(zip(subsystems, futures)):
+            try:
+                cfgmgr = future.result()
+            except Exception as e:
+                raise ConfigManagerCreationFailed(n) from e
+
+            nodes[i] = SubsystemNode(
+                name = n,
+                log = self.log,
+                cfgmgr = cfgmgr,
+                console=self.console,
+                fsm_conf = fsm_conf,
+                parent = parent
+            )
+            self.log.info(f'Loaded the configuration of \'{n}\' in {sum(cfgmgr.timings.values()):.2f} s ('+', '.join(f'{step}: {t:.2f} s' for step, t in cfgmgr.timings.items())+')')
+        if subsystems:
+            self.log.info(f'Loaded {len(subsystems)} subsystem configurations in {time.perf_counter()-start:.2f} s')
+
+        # the subsystem nodes were attached last, put the children back in the order of the configuration
+        for node, children in layout.items():
+            node.children = [nodes[c] if isinstance(c, int) else c for c in children]
+
     def get_custom_commands(self):
         ret = {}
         for node in PreOrderIter(self.topnode):
@@ -142,6 +181,8 @@ class TreeBuilder:
         self.topnode = StatefulNode(self.apparatus_id, console=self.console, log=self.log,
                                     fsm_conf=self.fsm_conf, order=cmd_order, verbose=True)
         self.extract_json_to_nodes(self.top_cfg, self.topnode, fsm_conf=self.fsm_conf)
+        for command in self.topnode.order:
+            self.topnode.command_graph(command) # make sure the command_order makes sense before going any further
 
     # This should get changed so that it copies the node, and strips the config
     def get_tree_structure(self):
@@ -0,0 +1,133 @@
+import logging
+import socket
+import socks
+import threading
+import time
+from typing import NoReturn
+
+from .metrics import registry as metrics
+
+# how many SOCKS handshakes can be in flight at once through the same proxy
+MAX_CONCURRENT_HANDSHAKES = 16
+# how long (in seconds) a probe connection is trusted: a half-open connection, or one to a dead pod
+# behind the proxy, still looks open, so the handshake (which reaches the app) is done again after that
+PROBE_MAX_AGE = 2.
+
+
+class SocksTunnel:
+    """
+    The SOCKS5 proxy in front of the applications (k8s mode), shared by all the applications going through it
+
+    The command port probes keep one tunnelled connection per application open and only
+    do a new handshake once it was closed or is PROBE_MAX_AGE old, instead of one handshake per probe.
+    The HTTP commands go through the same proxy with their own keep-alive connections (see proxies()).
+    """
+
+    tunnels = {}
+    tunnels_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, address: str, port: int):
+        with cls.tunnels_lock:
+            tunnel = cls.tunnels.get((address, port))
+            if tunnel is None:
+                tunnel = cls.tunnels[(address, port)] = cls(address, port)
+            return tunnel
+
+    def __init__(self, address: str, port: int):
+        self.log = logging.getLogger(f'{__name__}.{address}:{port}')
+        self.address = address
+        self.port = port
+        self.handshakes = threading.BoundedSemaphore(MAX_CONCURRENT_HANDSHAKES)
+        self.lock = threading.Lock()
+        # (host, port) -> [lock, open socket or None, when it was opened]
+        self.probes = {}
+        self.handshake_count = 0
+        self.handshake_time = 0.
+        self.failures = 0
+        self.reused = 0
+
+    def proxies(self) -> dict:
+        # socks5h: the names of the applications are resolved on the other side of the proxy
+        return {
+            'http': f'socks5h://{self.address}:{self.port}',
+            'https': f'socks5h://{self.address}:{self.port}',
+        }
+
+    def connect(self, host: str, port: int, timeout: float = 1.) -> socks.socksocket:
+        s = socks.socksocket(socket.AF_INET, socket.SOCK_STREAM)
+        s.set_proxy(socks.SOCKS5, self.address, self.port)
+        s.settimeout(timeout)
+        with self.handshakes:
+            start = time.perf_counter()
+            try:
+                s.connect((host, port))
+            except:
+                s.close()
+                with self.lock:
+                    self.failures += 1
+                raise
+            elapsed = time.perf_counter() - start
+        with self.lock:
+            self.handshake_count += 1
+            self.handshake_time += elapsed
+        metrics.observe('nanorc_socks_handshake_seconds', elapsed, proxy=f'{self.address}:{self.port}')
+        return s
+
+    @staticmethod
+    def _still_open(s) -> bool:
+        # nothing is ever sent on a probe connection: readable means the other side closed it
+        try:
+            s.setblocking(False)
+            return s.recv(1, socket.MSG_PEEK) != b''
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        finally:
+            try:
+                s.settimeout(1.)
+            except OSError:
+                pass
+
+    def ping(self, host: str, port: int) -> bool:
+        """
+        Whether host:port accepts connections through the proxy, reusing the previous probe connection
+        while it's open and recent enough, a failed handshake means it's down
+        """
+        with self.lock:
+            probe = self.probes.setdefault((host, port), [threading.Lock(), None, 0.])
+
+        with probe[0]:
+            s = probe[1]
+            if s is not None and time.monotonic() - probe[2] < PROBE_MAX_AGE and self._still_open(s):
+                with self.lock:
+                    self.reused += 1
+                return True
+            if s is not None:
+                s.close()
+                probe[1] = None
+            try:
+                probe[1] = self.connect(host, port)
+                probe[2] = time.monotonic()
+                return True
+            except:
+                return False
+
+    def forget(self, host: str, port: int) -> NoReturn:
+        with self.lock:
+            probe = self.probes.pop((host, port), None)
+        if probe is None:
+            return
+        with probe[0]:
+            if probe[1] is not None:
+                probe[1].close()
+                probe[1] = None
+
+    def __str__(self):
+        with self.lock:
+            probes = self.handshake_count + self.reused
+            return (f'SOCKS proxy {self.address}:{self.port}: {self.handshake_count} handshakes'
+                    + (f' (~{self.handshake_time/self.handshake_count*1000:.1f} ms each)' if self.handshake_count else '')
+                    + f', {self.failures} failed, {len([p for p in self.probes.values() if p[1] is not None])} open probe connections'
+                    + (f', {self.reused/probes*100:.0f}% of the probes reused a connection' if probes else ''))
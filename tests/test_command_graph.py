@@ -0,0 +1,51 @@
+import logging
+import pytest
+
+pytest.importorskip('anytree')
+
+from nanorc.statefulnode import StatefulNode
+
+
+def make_tree(order=None, children=('a', 'b', 'c', 'd')):
+    log = logging.getLogger('test')
+    top = StatefulNode('top', None, log, 'partition', order=order)
+    for name in children:
+        StatefulNode(name, None, log, 'partition', parent=top)
+    return top
+
+
+def test_declaration_order_by_default():
+    top = make_tree()
+    assert top.command_graph('conf') == {'a': set(), 'b': {'a'}, 'c': {'b'}, 'd': {'c'}}
+
+
+def test_list_of_names():
+    top = make_tree(order={'start': ['c', 'a']})
+    # only the children listed get the command
+    assert top.command_graph('start') == {'c': set(), 'a': {'c'}}
+    assert top.command_graph('conf') == {'a': set(), 'b': {'a'}, 'c': {'b'}, 'd': {'c'}}
+
+
+def test_stages():
+    top = make_tree(order={'start': [['a', 'b'], 'c', ['d']]})
+    assert top.command_graph('start') == {'a': set(), 'b': set(), 'c': {'a', 'b'}, 'd': {'c'}}
+    assert top._command_stages('start', top.command_graph('start')) == [['a', 'b'], ['c'], ['d']]
+
+
+def test_dependency_dict():
+    top = make_tree(order={'stop': {'a': ['b', 'c'], 'b': 'd', 'c': None}})
+    graph = top.command_graph('stop')
+    assert graph == {'a': {'b', 'c'}, 'b': {'d'}, 'c': set(), 'd': set()}
+    assert [sorted(stage) for stage in top._command_stages('stop', graph)] == [['c', 'd'], ['b'], ['a']]
+
+
+def test_unknown_child():
+    top = make_tree(order={'start': ['a', 'z']})
+    with pytest.raises(RuntimeError, match='aren\'t children'):
+        top.command_graph('start')
+
+
+def test_cycle():
+    top = make_tree(order={'start': {'a': ['b'], 'b': ['c'], 'c': ['a']}})
+    with pytest.raises(RuntimeError, match='cycle'):
+        top.command_graph('start')
@@ -0,0 +1,67 @@
+import os
+import json
+
+from nanorc.confcache import ConfigCache
+
+
+SERVICE = 'np04-srv-023:31011'
+
+
+def test_miss(tmp_path):
+    cache = ConfigCache(str(tmp_path))
+    assert cache.get(SERVICE, 'config', 3) is None
+
+
+def test_round_trip_keeps_key_order(tmp_path):
+    cache = ConfigCache(str(tmp_path))
+    # the boot order follows the order of the apps, which isn't alphabetical
+    conf = {'boot': {'apps': {'trigger': {}, 'dataflow': {}, 'ru0': {}}}, 'ru0': {'init': {}}, 'dataflow': {}}
+    content = json.dumps(conf).encode()
+    cache.put(SERVICE, 'config', 3, content)
+
+    cached = cache.get(SERVICE, 'config', 3)
+    assert cached == conf
+    assert list(cached) == ['boot', 'ru0', 'dataflow']
+    assert list(cached['boot']['apps']) == ['trigger', 'dataflow', 'ru0']
+    # and it's byte for byte what was received
+    blob, = os.listdir(tmp_path/'blobs')
+    assert (tmp_path/'blobs'/blob).read_bytes() == content
+
+
+def test_versions_and_services_are_separate(tmp_path):
+    cache = ConfigCache(str(tmp_path))
+    cache.put(SERVICE, 'config', 1, b'{"version": 1}')
+    cache.put(SERVICE, 'config', 2, b'{"version": 2}')
+
+    assert cache.get(SERVICE, 'config', 1) == {'version': 1}
+    assert cache.get(SERVICE, 'config', 2) == {'version': 2}
+    assert cache.get('other-service:31011', 'config', 1) is None
+    assert cache.get(SERVICE, 'other-config', 1) is None
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    cache = ConfigCache(str(tmp_path))
+    cache.put(SERVICE, 'config', 1, b'{"a": 1}')
+    cache.put(SERVICE, 'copy', 7, b'{"a": 1}')
+
+    assert len(os.listdir(tmp_path/'blobs')) == 1
+    assert cache.get(SERVICE, 'copy', 7) == {'a': 1}
+
+
+def test_corrupted_copy_is_dropped(tmp_path):
+    cache = ConfigCache(str(tmp_path))
+    cache.put(SERVICE, 'config', 1, b'{"a": 1}')
+    blob, = os.listdir(tmp_path/'blobs')
+    (tmp_path/'blobs'/blob).write_bytes(b'{"a": 2}')
+
+    assert cache.get(SERVICE, 'config', 1) is None
+    assert os.listdir(tmp_path/'blobs') == []
+    assert os.listdir(tmp_path/'refs') == []
+
+
+def test_unwritable_cache_is_not_an_error(tmp_path):
+    path = tmp_path/'file'
+    path.write_text('not a directory')
+    cache = ConfigCache(str(path))
+    cache.put(SERVICE, 'config', 1, b'{"a": 1}')
+    assert cache.get(SERVICE, 'config', 1) is None
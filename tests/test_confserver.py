@@ -0,0 +1,111 @@
+import gzip
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_restful')
+pytest.importorskip('rich')
+
+from flask import jsonify
+from nanorc.confserver import ConfServer, GZIP_MIN_SIZE
+
+
+@pytest.fixture
+def server():
+    # port 0: any free port, the requests go through the test client anyway
+    server = ConfServer(0)
+    yield server
+    server.terminate()
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+def upload(client, name, conf):
+    r = client.post('/configuration', query_string={'name': name}, json=conf)
+    assert r.get_json()['success']
+
+
+def get(client, headers={}, **args):
+    return client.get('/configuration', query_string=args, headers=headers)
+
+
+CONF = {
+    'boot': {'apps': {'trigger': {'port': 3333}, 'dataflow': {'port': 3334}}},
+    'trigger': {'init': {'modules': ['a', 'b']}, 'conf': {'rate': 1.}},
+    'empty': {},
+}
+
+
+def test_slices_are_serialised_like_jsonify(server, client):
+    upload(client, 'conf', CONF)
+    with server.app.app_context():
+        expected = {
+            (): jsonify(CONF).get_data(),
+            ('trigger',): jsonify(CONF['trigger']).get_data(),
+            ('trigger', 'conf'): jsonify(CONF['trigger']['conf']).get_data(),
+        }
+
+    assert get(client, name='conf').data == expected[()]
+    assert get(client, name='conf', app_name='trigger').data == expected[('trigger',)]
+    r = get(client, name='conf', app_name='trigger', cmd_name='conf')
+    assert r.status_code == 200
+    assert r.data == expected[('trigger', 'conf')]
+    assert r.headers['Content-Type'] == 'application/json'
+
+
+def test_missing_and_empty(client):
+    upload(client, 'conf', CONF)
+    upload(client, 'nothing', {})
+    assert get(client, name='other').status_code == 404
+    assert get(client, name='conf', app_name='empty').status_code == 404
+    assert get(client, name='conf', app_name='trigger', cmd_name='start').status_code == 404
+    assert get(client, name='nothing').status_code == 204
+
+
+def test_etag_and_304(client):
+    upload(client, 'conf', CONF)
+    r = get(client, name='conf', app_name='trigger')
+    etag = r.headers['ETag']
+    assert etag
+
+    r = get(client, {'If-None-Match': etag}, name='conf', app_name='trigger')
+    assert r.status_code == 304
+    assert r.data == b''
+    assert r.headers['ETag'] == etag
+
+    # another slice, or the same one once the configuration changed, doesn't match
+    assert get(client, {'If-None-Match': etag}, name='conf', app_name='boot').status_code == 200
+    upload(client, 'conf', {**CONF, 'trigger': {'init': {'modules': ['c']}}})
+    r = get(client, {'If-None-Match': etag}, name='conf', app_name='trigger')
+    assert r.status_code == 200
+    assert r.headers['ETag'] != etag
+
+
+def test_gzip(client):
+    big = {'app': {'init': {'modules': [f'module_{i}' for i in range(GZIP_MIN_SIZE)]}}}
+    upload(client, 'big', big)
+
+    plain = get(client, name='big', app_name='app')
+    assert 'Content-Encoding' not in plain.headers
+    assert len(plain.data) >= GZIP_MIN_SIZE
+
+    r = get(client, {'Accept-Encoding': 'gzip'}, name='big', app_name='app')
+    assert r.status_code == 200
+    assert r.headers['Content-Encoding'] == 'gzip'
+    assert r.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(r.data) == plain.data
+    # the compressed representation has its own ETag
+    assert r.headers['ETag'] != plain.headers['ETag']
+
+    r = get(client, {'Accept-Encoding': 'gzip', 'If-None-Match': r.headers['ETag']}, name='big', app_name='app')
+    assert r.status_code == 304
+    assert get(client, {'If-None-Match': plain.headers['ETag']}, name='big', app_name='app').status_code == 304
+
+
+def test_small_slices_are_not_compressed(client):
+    upload(client, 'conf', CONF)
+    r = get(client, {'Accept-Encoding': 'gzip'}, name='conf', app_name='trigger', cmd_name='conf')
+    assert 'Content-Encoding' not in r.headers
+    assert r.get_json() == CONF['trigger']['conf']
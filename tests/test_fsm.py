@@ -0,0 +1,64 @@
+import pytest
+
+from nanorc.fsm import FSM, FSMError, get_fsm
+
+
+def test_acting_and_finalisor_transitions():
+    fsm = FSM(None, 'partition')
+
+    assert fsm.initial == 'none'
+    assert 'conf_ing' in fsm.transient_states
+    assert fsm.next_state('initial', 'conf') == 'conf_ing'
+    assert fsm.next_state('conf_ing', 'end_conf') == 'configured'
+    assert fsm.next_state('configured', 'start') == 'start_ing'
+    assert fsm.next_state('start_ing', 'end_start') == 'ready'
+    assert fsm.next_state('error', 'terminate') == 'terminate_ing'
+
+
+def test_wildcard_source():
+    fsm = FSM(None, 'partition')
+    for state in fsm.states:
+        assert fsm.next_state(state, 'abort') == 'abort_ing'
+    assert fsm.next_state('abort_ing', 'end_abort') == 'none'
+
+
+def test_to_state_from_anywhere():
+    fsm = FSM(None, 'partition')
+    assert fsm.next_state('running', 'to_error') == 'error'
+    assert fsm.next_state('conf_ing', 'to_initial') == 'initial'
+    assert fsm.is_trigger('to_error')
+    assert not fsm.is_trigger('to_nowhere')
+    with pytest.raises(FSMError):
+        fsm.next_state('running', 'to_nowhere')
+
+
+def test_impossible_transitions():
+    fsm = FSM(None, 'partition')
+    with pytest.raises(FSMError):
+        fsm.next_state('initial', 'start')
+    assert fsm.can('initial', 'conf')
+    assert not fsm.can('initial', 'start')
+    # the finalisors can't be asked for
+    assert not fsm.can('conf_ing', 'end_conf')
+
+
+def test_destinations():
+    fsm = FSM(None, 'partition')
+    assert fsm.get_destination('stop') == 'configured'
+    assert fsm.get_destination('terminate') == 'none'
+    with pytest.raises(RuntimeError):
+        fsm.get_destination('not_a_transition')
+
+
+def test_timing_fsm():
+    fsm = FSM(None, 'timing')
+    assert fsm.next_state('configured', 'start') == 'start_ing'
+    assert fsm.next_state('start_ing', 'end_start') == 'running'
+    assert 'enable_triggers' not in fsm.triggers
+
+
+def test_fsms_are_shared():
+    assert get_fsm(None, 'timing') is get_fsm(None, 'timing')
+    # anything that isn't timing is the partition FSM
+    assert get_fsm(None, 'partition') is get_fsm(None, 'whatever')
+    assert get_fsm(None, 'timing') is not get_fsm(None, 'partition')
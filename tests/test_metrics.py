@@ -0,0 +1,69 @@
+import math
+import pytest
+
+from nanorc.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_buckets():
+    h = Histogram(buckets=(0.1, 1., math.inf))
+    for value in [0.05, 0.1, 0.5, 2., 30.]:
+        h.observe(value)
+
+    assert h.counts == [2, 1, 2]
+    assert h.count == 5
+    assert h.sum == 32.65
+    assert h.max == 30.
+    assert h.mean() == pytest.approx(6.53)
+    assert h.cumulative_counts() == [(0.1, 2), (1., 3), (math.inf, 5)]
+
+
+def test_histogram_quantile():
+    h = Histogram(buckets=(0.1, 1., math.inf))
+    assert h.quantile(0.5) == 0.
+    assert h.mean() == 0.
+
+    for value in [0.05, 0.05, 0.5, 3.]:
+        h.observe(value)
+
+    assert h.quantile(0.5) == 0.1
+    assert h.quantile(0.75) == 1.
+    # the overflow bucket reports the max
+    assert h.quantile(1.) == 3.
+
+
+def test_registry_rejects_unknown_metrics():
+    registry = MetricsRegistry()
+    with pytest.raises(RuntimeError):
+        registry.observe('nanorc_not_a_metric', 1.)
+
+
+def test_registry_keys_by_labels():
+    registry = MetricsRegistry()
+    registry.observe('nanorc_command_ack_seconds', 0.2, app='b', command='conf')
+    registry.observe('nanorc_command_ack_seconds', 0.1, command='conf', app='b')
+    registry.observe('nanorc_command_ack_seconds', 0.3, app='a', command='conf')
+
+    assert registry.get('nanorc_command_ack_seconds', app='b', command='conf').count == 2
+    assert registry.get('nanorc_command_ack_seconds', app='c', command='conf') is None
+    assert [labels['app'] for labels, _ in registry.series('nanorc_command_ack_seconds')] == ['a', 'b']
+
+    registry.reset()
+    assert registry.series('nanorc_command_ack_seconds') == []
+
+
+def test_to_prometheus():
+    registry = MetricsRegistry()
+    assert registry.to_prometheus() == '\n'
+
+    registry.observe('nanorc_transition_seconds', 0.003, subsystem='top "1"', command='start')
+    lines = registry.to_prometheus().splitlines()
+
+    assert lines[0] == '# HELP nanorc_transition_seconds Time a subsystem took to send a command to its applications and collect all the replies'
+    assert lines[1] == '# TYPE nanorc_transition_seconds histogram'
+    assert 'nanorc_transition_seconds_bucket{command="start",subsystem="top \\"1\\"",le="0.0025"} 0' in lines
+    assert 'nanorc_transition_seconds_bucket{command="start",subsystem="top \\"1\\"",le="0.005"} 1' in lines
+    assert 'nanorc_transition_seconds_bucket{command="start",subsystem="top \\"1\\"",le="+Inf"} 1' in lines
+    assert lines[-2] == 'nanorc_transition_seconds_sum{command="start",subsystem="top \\"1\\""} 0.003'
+    assert lines[-1] == 'nanorc_transition_seconds_count{command="start",subsystem="top \\"1\\""} 1'
+    # only the metrics with observations are exported
+    assert not any('nanorc_command_ack_seconds' in line for line in lines)
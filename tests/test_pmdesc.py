@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip('click')
+pytest.importorskip('sh')
+pytest.importorskip('kubernetes')
+
+import click
+from nanorc.pmdesc import pm_desc
+from nanorc.k8spm import DEFAULT_K8S_PARALLEL
+from nanorc.sshpm import DEFAULT_SSH_PARALLEL, DEFAULT_SSH_PER_HOST, DEFAULT_TERMINATE_GRACE
+
+
+def test_ssh_defaults():
+    pm = pm_desc('ssh://')
+    assert pm.use_sshpm() and not pm.use_k8spm() and not pm.use_localpm()
+    assert pm.ssh_parallel == DEFAULT_SSH_PARALLEL
+    assert pm.ssh_per_host == DEFAULT_SSH_PER_HOST
+    assert pm.ssh_multiplex
+    assert pm.ssh_launcher == 'app'
+    assert pm.ssh_grace == DEFAULT_TERMINATE_GRACE
+
+
+def test_ssh_options():
+    pm = pm_desc('ssh://?parallel=4&per-host=2&multiplex=no&launcher=host&grace=0')
+    assert pm.ssh_parallel == 4
+    assert pm.ssh_per_host == 2
+    assert not pm.ssh_multiplex
+    assert pm.ssh_launcher == 'host'
+    # no grace at all is allowed: the apps are killed straight away
+    assert pm.ssh_grace == 0
+
+
+def test_k8s_options():
+    pm = pm_desc('k8s://np04-srv-001:31000')
+    assert pm.use_k8spm() and not pm.use_sshpm()
+    assert (pm.address, pm.port) == ('np04-srv-001', 31000)
+    assert pm.k8s_parallel == DEFAULT_K8S_PARALLEL
+    # pulling the images on the nodes is opt-in
+    assert not pm.k8s_prepull
+
+    pm = pm_desc('kind://?parallel=64&prepull=yes')
+    assert (pm.address, pm.port) == ('localhost', 31000)
+    assert pm.k8s_parallel == 64
+    assert pm.k8s_prepull
+
+
+def test_last_value_wins():
+    assert pm_desc('ssh://?grace=5&grace=10').ssh_grace == 10
+
+
+@pytest.mark.parametrize('uri', [
+    'ssh://?grace=-1',
+    'ssh://?grace=soon',
+    'ssh://?parallel=0',
+    'ssh://?multiplex=maybe',
+    'ssh://?launcher=cluster',
+    'ssh://?grace',
+    'k8s://?parallel=0',
+    'k8s://?parallel=lots',
+    'http://',
+])
+def test_bad_options(uri):
+    with pytest.raises(click.BadParameter):
+        pm_desc(uri)
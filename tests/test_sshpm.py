@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip('sh')
+pytest.importorskip('rich')
+
+from nanorc import sshpm
+from nanorc.sshpm import SSHProcessManager
+
+
+class Desc:
+    def __init__(self, name, host, port):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.ssh_args = [host]
+
+
+@pytest.fixture
+def pm(monkeypatch):
+    pm = SSHProcessManager(console=None, log_path=None, ssh_conf=[])
+    monkeypatch.setattr(sshpm, 'is_port_open', lambda host, port: False)
+    yield pm
+    pm.close_masters()
+
+
+def failing_master(host):
+    raise RuntimeError(f'Couldn\'t open a master connection to {host}: Permission denied')
+
+
+def test_direct_ssh_when_the_master_fails(pm, monkeypatch, caplog):
+    knocked = []
+    monkeypatch.setattr(pm, 'open_master', failing_master)
+    monkeypatch.setattr(pm, 'ssh', lambda host, args: knocked.append(host))
+
+    pm.check_hosts([Desc('ru0', 'np04-srv-001', 3333), Desc('ru1', 'np04-srv-001', 3334)])
+
+    assert knocked == ['np04-srv-001']
+    assert pm.masters == set()
+    assert 'np04-srv-001 will not use multiplexing' in caplog.text
+
+
+def test_unreachable_when_the_direct_ssh_fails(pm, monkeypatch):
+    def failing_ssh(host, args):
+        raise RuntimeError('Connection refused')
+    monkeypatch.setattr(pm, 'open_master', failing_master)
+    monkeypatch.setattr(pm, 'ssh', failing_ssh)
+
+    with pytest.raises(RuntimeError, match=r'cannot ssh to 1 host\(s\): np04-srv-001 \(Connection refused\)'):
+        pm.check_hosts([Desc('ru0', 'np04-srv-001', 3333)])